@@ -0,0 +1,9 @@
+"""
+Benchmarks of the Mokum Airlines simulation.
+
+Run from the root of the project with:
+    python -m benchmark --locations 50 --planes 10 --trips 8
+
+A seeded scenario (see scenario.py) is written in the resources format, loaded and
+timed (see benchmarks.py). Results are written as JSON and compared to a stored baseline.
+"""
@@ -0,0 +1,101 @@
+from __future__ import division
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+
+from benchmark.scenario import generateScenario
+from benchmark.benchmarks import runBenchmarks, compareToBaseline
+from benchmark.checks import checkEventTimeline
+from mokum import Simulation
+
+defaultBaselinePath = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description = "Benchmark the Mokum Airlines simulation on a generated scenario.")
+    parser.add_argument("--locations", type = int, default = 21, help = "number of locations")
+    parser.add_argument("--planes", type = int, default = 6, help = "number of planes")
+    parser.add_argument("--trips", type = int, default = 6, help = "number of trips per plane")
+    parser.add_argument("--seed", type = int, default = 0, help = "seed of the scenario and random times")
+    parser.add_argument("--repeats", type = int, default = 3, help = "repeats per benchmark, the fastest is kept")
+    parser.add_argument("--scenario", default = None, help = "directory to write the scenario to (default: temporary)")
+    parser.add_argument("--output", default = "benchmarkresults.json", help = "file to write the results to")
+    parser.add_argument("--baseline", default = defaultBaselinePath, help = "results to compare against")
+    parser.add_argument("--save-baseline", action = "store_true", help = "store the results as the new baseline")
+    parser.add_argument("--tolerance", type = float, default = .25, help = "allowed slowdown before a regression")
+    parser.add_argument("--check", action = "store_true", help = "only check the event timeline against the frames")
+    args = parser.parse_args(arguments)
+
+    if args.check:
+        return check(args)
+
+    scenarioPath = args.scenario if args.scenario is not None else tempfile.mkdtemp(prefix = "mokumbenchmark")
+    try:
+        generateScenario(scenarioPath, args.locations, args.planes, args.trips, seed = args.seed)
+        results = runBenchmarks(scenarioPath, repeats = args.repeats, seed = args.seed)
+    finally:
+        if args.scenario is None:
+            shutil.rmtree(scenarioPath)
+
+    report = {
+        "scenario" : {"locations" : args.locations, "planes" : args.planes, "trips" : args.trips, "seed" : args.seed},
+        "python" : platform.python_version(),
+        "results" : results
+    }
+
+    outputFile = open(args.output, 'w')
+    json.dump(report, outputFile, indent = 2, sort_keys = True)
+    outputFile.close()
+
+    for name in sorted(results):
+        print "%-16s %10.4f s" %(name, results[name]["seconds"])
+
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print "Saved results as baseline: " + args.baseline
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print "No baseline found at: " + args.baseline + ", run with --save-baseline to store one."
+        return 0
+
+    baselineFile = open(args.baseline)
+    baseline = json.load(baselineFile)
+    baselineFile.close()
+
+    if baseline["scenario"] != report["scenario"]:
+        print "Warning: baseline was made for scenario " + str(baseline["scenario"])
+
+    regressed = False
+    for name, seconds, baselineSeconds, ratio, isRegression in compareToBaseline(results, baseline["results"], args.tolerance):
+        print "%-16s %10.4f s vs %10.4f s (x%.2f)%s" %(name, seconds, baselineSeconds, ratio,
+                                                        " REGRESSION" if isRegression else "")
+        regressed = regressed or isRegression
+
+    return 1 if regressed else 0
+
+def check(args):
+    """
+    Check the event timeline against the frames, on the scenario and on the scenario with
+    overlapping trips (which the GUI still has to show as the frames do).
+    """
+    failed = False
+    for overlap in (0, 30):
+        scenarioPath = tempfile.mkdtemp(prefix = "mokumcheck")
+        try:
+            generateScenario(scenarioPath, args.locations, args.planes, args.trips, seed = args.seed, overlap = overlap)
+            simulation = Simulation(runPreSimulation = False, frameCacheSize = 0, resourcesPath = scenarioPath)
+            mismatches = checkEventTimeline(simulation, seed = args.seed)
+        finally:
+            shutil.rmtree(scenarioPath)
+
+        print "overlap %3d minutes: %d logs differ from the frames" %(overlap, mismatches)
+        failed = failed or mismatches > 0
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
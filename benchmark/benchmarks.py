@@ -0,0 +1,92 @@
+from __future__ import division
+import random
+import timeit
+
+from mokum import Simulation
+import mokumplotter
+
+def timeFunction(function, repeats):
+    """
+    Call function repeats times and return the fastest wall time in seconds.
+    """
+    times = []
+    for i in range(repeats):
+        start = timeit.default_timer()
+        function()
+        times.append(timeit.default_timer() - start)
+    return min(times)
+
+def runBenchmarks(resourcesPath, repeats = 3, numRandomTimes = 100, seed = 0):
+    """
+    Time the main stages of a simulation of the scenario in resourcesPath:
+    - load: reading and interpreting all files.
+    - preSimulation: checking all requirements.
+    - simulationLogAt: building complete SimulationLogs at numRandomTimes random times.
+    - fullDay: getting the log of every plane for every minute from start to end time (see Simulation.run).
+    - plotData: collecting all metrics plotted by mokumplotter (mokumplotter.collectMetrics).
+    - guiFrame: computing what the GUI draws for a frame at numRandomTimes random times.
+    The frame cache is disabled, so every frame is computed.
+    :returns: dict of benchmark name to dict with the fastest time in seconds and repeats.
+    """
+    randomGen = random.Random(seed)
+    results = {}
+
+    def load():
+        Simulation(runPreSimulation = False, frameCacheSize = 0, resourcesPath = resourcesPath)
+    results["load"] = timeFunction(load, repeats)
+
+    simulation = Simulation(runPreSimulation = False, frameCacheSize = 0, resourcesPath = resourcesPath)
+    results["preSimulation"] = timeFunction(simulation.preSimulation, repeats)
+
+    startTime = simulation.getStartTime()
+    endTime = simulation.getEndTime()
+    randomTimes = [randomGen.uniform(startTime, endTime) for i in range(numRandomTimes)]
+
+    def simulationLogAt():
+        for time in randomTimes:
+            simulationLog = simulation.getSimulationLogAt(time)
+            simulationLog.getPlaneToLog()
+            simulationLog.getConnectionToLog()
+    results["simulationLogAt"] = timeFunction(simulationLogAt, repeats)
+
+    def fullDay():
+        for time in range(startTime, endTime):
+            simulationLog = simulation.getSimulationLogAt(time)
+            simulationLog.getPlaneToLog()
+    results["fullDay"] = timeFunction(fullDay, repeats)
+
+    def plotData():
+        # see mokumplotter.plotAll, without drawing the plots.
+        mokumplotter.collectMetrics(simulation)
+    results["plotData"] = timeFunction(plotData, repeats)
+
+    planes = simulation.getPlanes()
+    locations = simulation.getLocations()
+    def guiFrame():
+        for i, time in enumerate(randomTimes):
+            # see SimulationGUI.drawSimulation, PlaneTable and LocationTable.
+            simulationLog = simulation.getSimulationLogAt(time)
+            for planeLog in simulationLog.getPlaneLogs():
+                planeLog.getCoords()
+                planeLog.getTrip()
+            simulationLog.getPlaneLog(planes[i % len(planes)]).getPassengers()
+            for connection in locations[i % len(locations)].getConnections():
+                simulationLog.getConnectionLog(connection).getPotentialPassengers()
+    results["guiFrame"] = timeFunction(guiFrame, repeats)
+
+    return dict((name, {"seconds" : seconds, "repeats" : repeats}) for name, seconds in results.items())
+
+def compareToBaseline(results, baseline, tolerance):
+    """
+    Compare benchmark results to baseline results (both as returned by runBenchmarks).
+    A benchmark has regressed if it is more than tolerance (fraction) slower than its baseline.
+    :returns: list of tuples (name, seconds, baselineSeconds, ratio, regressed), sorted by name.
+    """
+    comparison = []
+    for name in sorted(results):
+        if name in baseline:
+            seconds = results[name]["seconds"]
+            baselineSeconds = baseline[name]["seconds"]
+            ratio = seconds / baselineSeconds if baselineSeconds > 0 else float("inf")
+            comparison.append((name, seconds, baselineSeconds, ratio, ratio > 1 + tolerance))
+    return comparison
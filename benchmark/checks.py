@@ -0,0 +1,41 @@
+from __future__ import division
+import random
+
+def _getPlaneLogKey(planeLog):
+    return (planeLog.getFuel(), tuple(planeLog.getCoords()), sorted((str(connection), numPassengers)\
+            for connection, numPassengers in planeLog.getPassengers().items()),
+            planeLog.getPassengerKilometers(), planeLog.getTrip())
+
+def checkEventTimeline(simulation, numRandomTimes = 100, seed = 0):
+    """
+    Compare the logs of the EventTimeline and of a SimulationCursor moving through the
+    simulation to the logs of its frames (Simulation.getSimulationLogAt), every minute and
+    at numRandomTimes random times.
+    :returns: number of plane and connection logs that differ.
+    """
+    randomGen = random.Random(seed)
+    startTime = simulation.getStartTime()
+    endTime = simulation.getEndTime()
+    times = range(startTime, endTime) + [randomGen.uniform(startTime, endTime) for i in range(numRandomTimes)]
+
+    eventTimeline = simulation.getEventTimeline()
+    cursor = simulation.getCursor()
+    planes = [plane for plane in simulation.getPlanes() if len(plane.getTrips()) > 0]
+    mismatches = 0
+
+    for time in times:
+        cursor.seek(time)
+        simulationLog = simulation.getSimulationLogAt(time)
+        eventLog = eventTimeline.getSimulationLogAt(time)
+
+        for plane in planes:
+            planeLogKey = _getPlaneLogKey(simulationLog.getPlaneLog(plane))
+            mismatches += planeLogKey != _getPlaneLogKey(eventLog.getPlaneLog(plane))
+            mismatches += planeLogKey != _getPlaneLogKey(cursor.getPlaneLog(plane))
+
+        for connection in simulation.getConnections():
+            potentialPassengers = simulationLog.getConnectionLog(connection).getPotentialPassengers()
+            mismatches += potentialPassengers != eventLog.getConnectionLog(connection).getPotentialPassengers()
+            mismatches += potentialPassengers != cursor.getConnectionLog(connection).getPotentialPassengers()
+
+    return mismatches
@@ -0,0 +1,127 @@
+from __future__ import division
+import math
+import os
+import random
+
+import mokum
+
+mapWidth = 440 # locations are placed on the map of the GUI (450 x 450 pixels).
+mapHeight = 440
+kilometersPerPixel = 2.5 # keeps every distance below half of maxFuel, see generateScenario.
+planeMaxPassengers = 147
+planeSpeed = 800
+planeMaxFuel = 3600
+minPotentialPassengers = 50
+maxPotentialPassengers = 350
+
+def generateScenario(path, numLocations, numPlanes, numTripsPerPlane, seed = 0, overlap = 0):
+    """
+    Write a random, but valid, scenario in the resources format to directory path.
+    Every plane starts at home (the first location) at the end of the no fly period and
+    makes numTripsPerPlane trips back to back, the last one returning home. A plane refuels
+    whenever its fuel drops below half of maxFuel, which is enough for any single trip.
+    :param path: directory to write config.txt, locations.txt etc. to, created if needed.
+    :param seed: seed of the random generator, equal seeds give equal scenarios.
+    :param overlap: minutes every trip starts before the previous trip of its plane ends,
+    0 for a valid scenario (see benchmark.checks).
+    :returns: path
+    """
+    if numLocations < 3:
+        raise ValueError("A scenario needs at least 3 locations, " + str(numLocations) + " given.")
+    if numTripsPerPlane < 2:
+        raise ValueError("A plane needs at least 2 trips to return home, " + str(numTripsPerPlane) + " given.")
+
+    randomGen = random.Random(seed)
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    names = ["Location%03d" %(i) for i in range(numLocations)]
+    coords = [(randomGen.randint(0, mapWidth), randomGen.randint(0, mapHeight)) for i in range(numLocations)]
+
+    distances = [[0] * numLocations for i in range(numLocations)]
+    potentialPassengers = [[0] * numLocations for i in range(numLocations)]
+    for i in range(numLocations):
+        for j in range(numLocations):
+            if i != j:
+                pixels = math.sqrt((coords[i][0] - coords[j][0])**2 + (coords[i][1] - coords[j][1])**2)
+                distances[i][j] = max(1, int(pixels * kilometersPerPixel))
+                potentialPassengers[i][j] = randomGen.randint(minPotentialPassengers, maxPotentialPassengers)
+
+    trips, passengersOnTrips, endTime = _generateTrips(randomGen, names, distances, potentialPassengers,
+                                                        numPlanes, numTripsPerPlane, overlap)
+
+    _writeLines(os.path.join(path, mokum.configFileName),
+                ["starttime=%d" %(mokum.defaultStartTime), "endtime=%d" %(endTime),
+                 "noflystart=%d" %(mokum.defaultNoFlyStart), "noflyend=%d" %(mokum.defaultNoFlyEnd),
+                 "home=%s" %(names[0])])
+    _writeLines(os.path.join(path, mokum.locationsFileName),
+                ["%d,%d,%d,%s" %(x, y, i, names[i]) for i, (x, y) in enumerate(coords)])
+    _writeLines(os.path.join(path, mokum.connectionsFileName),
+                [",".join(str(distance) for distance in row) for row in distances])
+    _writeLines(os.path.join(path, mokum.passengersFileName),
+                [",".join(str(numPassengers) for numPassengers in row) for row in potentialPassengers])
+    _writeLines(os.path.join(path, mokum.planesFileName),
+                ["plane%d,%d,boeing737,%d,%d" %(i, planeMaxPassengers, planeSpeed, planeMaxFuel) for i in range(numPlanes)])
+    _writeLines(os.path.join(path, mokum.tripsFileName), trips)
+    _writeLines(os.path.join(path, mokum.passengersOnTripFileName), passengersOnTrips)
+
+    return path
+
+def _generateTrips(randomGen, names, distances, potentialPassengers, numPlanes, numTripsPerPlane, overlap):
+    """
+    Generate the lines of trips.txt and passengersontrip.txt, and the end time of the scenario.
+    """
+    numLocations = len(names)
+    home = 0
+    remainingPassengers = [row[:] for row in potentialPassengers]
+    trips = []
+    passengersOnTrips = []
+    endTime = mokum.defaultEndTime
+
+    for planeNum in range(numPlanes):
+        location = home
+        time = mokum.defaultNoFlyEnd
+        fuel = planeMaxFuel
+
+        for tripNum in range(numTripsPerPlane):
+            if tripNum == numTripsPerPlane - 1:
+                destination = home
+            else:
+                destination = randomGen.randrange(numLocations - 1)
+                if destination >= location:
+                    destination += 1
+
+                # the second to last trip may not end at home, the last trip has to go somewhere.
+                if tripNum == numTripsPerPlane - 2 and destination == home:
+                    destination = (home + 1) if location != home + 1 else (home + 2) % numLocations
+
+            distance = distances[location][destination]
+            fuel -= distance
+            refuel = fuel < planeMaxFuel / 2
+            if refuel:
+                fuel = planeMaxFuel
+
+            tripName = "trip%d_%d" %(planeNum, tripNum)
+            trips.append("%s,%f,plane%d,%s,%s,%d" %(tripName, time, planeNum, names[location], names[destination], refuel))
+
+            numPassengers = randomGen.randint(0, min(planeMaxPassengers, remainingPassengers[location][destination]))
+            if numPassengers > 0:
+                remainingPassengers[location][destination] -= numPassengers
+                passengersOnTrips.append("%s,%d,%s" %(tripName, numPassengers, names[destination]))
+
+            time += distance / (planeSpeed / 60) + mokum.waitAtAirport
+            if refuel:
+                time += mokum.waitAtRefuel
+            time = math.ceil(time) - overlap # whole minutes, so the start time is not rounded in trips.txt.
+            location = destination
+
+        endTime = max(endTime, int(time) + 1)
+
+    return trips, passengersOnTrips, endTime
+
+def _writeLines(fileName, lines):
+    """ Write lines to fileName, without a blank line at the end (see readme). """
+    outputFile = open(fileName, 'w')
+    outputFile.write("\n".join(lines))
+    outputFile.close()
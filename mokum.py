@@ -1,14 +1,30 @@
 from __future__ import division
+import bisect
+import collections
+import heapq
+import json
+import marshal
 import math
+import numpy
+import struct
+import sys
+import timeit
 
 resourcesFilePath = "resources"
-configFilePath = resourcesFilePath + "/config.txt"
-locationsFilePath = resourcesFilePath + "/locations.txt"
-connectionsFilePath = resourcesFilePath + "/connections.txt"
-tripsFilePath = resourcesFilePath + "/trips.txt"
-planesFilePath = resourcesFilePath + "/planes.txt"
-passengersFilePath = resourcesFilePath + "/passengers.txt"
-passengersOnTripFilePath = resourcesFilePath + "/passengersontrip.txt"
+configFileName = "config.txt"
+locationsFileName = "locations.txt"
+connectionsFileName = "connections.txt"
+tripsFileName = "trips.txt"
+planesFileName = "planes.txt"
+passengersFileName = "passengers.txt"
+passengersOnTripFileName = "passengersontrip.txt"
+configFilePath = resourcesFilePath + "/" + configFileName
+locationsFilePath = resourcesFilePath + "/" + locationsFileName
+connectionsFilePath = resourcesFilePath + "/" + connectionsFileName
+tripsFilePath = resourcesFilePath + "/" + tripsFileName
+planesFilePath = resourcesFilePath + "/" + planesFileName
+passengersFilePath = resourcesFilePath + "/" + passengersFileName
+passengersOnTripFilePath = resourcesFilePath + "/" + passengersOnTripFileName
 
 waitAtAirport = 60
 waitAtRefuel = 60
@@ -16,6 +32,21 @@ defaultStartTime = 0 # if starttime set in config.txt, this is unused.
 defaultEndTime = 1440 # if endtime set in config.txt, this is unused.
 defaultNoFlyStart = 120 # if noflystart set in config.txt, this is unused.
 defaultNoFlyEnd = 360 # if noflyend set in config.txt, this is unused.
+defaultCycles = 1 # if cycles set in config.txt, this is unused.
+minutesPerDay = 1440 # with cycles the no fly zone holds on every day.
+defaultFrameCacheSize = 256 # max number of SimulationLogs kept by getSimulationLogAt.
+
+# types of SimulationEvents, see EventTimeline.
+takeoffEvent = "takeoff"
+landingEvent = "landing"
+passengersDroppedEvent = "passengersdropped"
+refuelEvent = "refuel"
+readyEvent = "ready"
+
+exportFields = ["coords", "fuel", "passengers", "passengerkilometers", "trip"] # fields run can export.
+exportFormats = ["text", "csv", "jsonl", "binary"] # formats run can export to, see TrajectoryWriter.
+exportChunkSize = 1024 # number of times evaluated at once while exporting.
+cursorCheckpointInterval = 64 # number of events between two checkpoints of a SimulationCursor.
 
 class Simulation(object):
     """
@@ -32,6 +63,9 @@ class Simulation(object):
     If it does not, it is created. For example:
     Requesting a frame at time = 300 or by setting startTime = 300, all previous
     time = 0,1,...,298,299 frames are created.
+    The most recently requested frames are kept in a FrameCache, so requesting the
+    same frame twice is cheap. Frames of an older version of the flightplan (before
+    adding or removing a trip, or changing a refuel) are never returned.
     
     Data location:
     - Configuration of simulation can be found in config.txt
@@ -50,6 +84,14 @@ class Simulation(object):
     (checked in runtime or pre simulation)
     - A plane must wait at least 1 hour after landing. (checked in runtime or pre-simulation)
     - A plane must wait one extra hour if the plane refuels. (checked in runtime or pre-simulation)
+
+    Multiple days:
+    With cycles (and optionally period, default endtime - starttime) set in config.txt, the
+    trips repeat every period for cycles times. Frames still cover one cycle, the state of a
+    plane at any time of any cycle is extrapolated from it by getPlaneStateAt. The passengers
+    in passengers.txt are the demand per cycle. The no fly zone is checked on every day, a
+    trip may then end in the next cycle (past midnight), as long as it ends before the first
+    trip of that cycle starts, and planes must end a cycle without passengers.
     
     Limitations:
     - Once a frame has been created, it cannot be undone and/or recreated. 
@@ -57,35 +99,167 @@ class Simulation(object):
     - A plane cannot be stalled in air to wait for the no fly zone to pass.
     """
     
-    def __init__(self, runPreSimulation = True):
+    def __init__(self, runPreSimulation = True, frameCacheSize = defaultFrameCacheSize,
+                  resourcesPath = resourcesFilePath, instrument = False):
+        self._setResourcesPath(resourcesPath)
         self.flightPlan = FlightPlan()
+        self.stats = None
+        if instrument:
+            self.enableInstrumentation()
+
+        self.frameCache = FrameCache(frameCacheSize)
+        self.eventTimeline = None # EventTimeline, (re)built lazily in getEventTimeline.
         self.startTime = defaultStartTime
         self.endTime = defaultEndTime
         self.noFlyStart = defaultNoFlyStart
         self.noFlyEnd = defaultNoFlyEnd
+        self.cycles = defaultCycles
+        self.period = None # endTime - startTime if not set in config.txt.
         
         self.home = None
+        self.planeToCheckedVersion = {} # version of each plane at the last successful preSimulation.
+        self.planeToCheckedConnections = {} # passenger connections of each plane at that preSimulation.
+
+        # too many passengers in the files are left to preSimulation (and mokumvalidator) to report.
+        self.flightPlan.getDemandLedger().setEnforced(False)
         self._loadData()
+        self.flightPlan.getDemandLedger().setEnforced(True)
         if self.home is None:
             raise ValueError("No home location set in config.txt.")
+        if self.period is None:
+            self.period = self.endTime - self.startTime
+        if self.cycles < 1 or self.period <= 0:
+            raise ValueError("Illegal cycles: " + str(self.cycles) + " and period: " + str(self.period) +\
+                              " set in config.txt, both must be > 0.")
         
         if runPreSimulation:
             self.preSimulation()
         
-    def run(self):
+    def _setResourcesPath(self, resourcesPath):
+        """
+        Set the directory all data files are read from (and saved to).
+        """
+        self.resourcesPath = resourcesPath
+        self.configFilePath = resourcesPath + "/" + configFileName
+        self.locationsFilePath = resourcesPath + "/" + locationsFileName
+        self.connectionsFilePath = resourcesPath + "/" + connectionsFileName
+        self.tripsFilePath = resourcesPath + "/" + tripsFileName
+        self.planesFilePath = resourcesPath + "/" + planesFileName
+        self.passengersFilePath = resourcesPath + "/" + passengersFileName
+        self.passengersOnTripFilePath = resourcesPath + "/" + passengersOnTripFileName
+
+    def getResourcesPath(self):
+        return self.resourcesPath
+
+    def enableInstrumentation(self):
+        """
+        Start counting calls and wall time of the hot paths of the simulation (see
+        instrumentedMethods). Can also be enabled on creation with instrument = True,
+        to include loading the files.
+        :returns: the stats of this simulation, kept over enabling and disabling.
+        :rtype: SimulationStats
+        """
+        if self.stats is None:
+            self.stats = SimulationStats(self.flightPlan)
+        self.stats.enable()
+        return self.stats
+
+    def disableInstrumentation(self):
+        if self.stats is not None:
+            self.stats.disable()
+
+    def getStats(self):
+        """
+        Get the SimulationStats of this simulation, None if instrumentation was never enabled.
+        """
+        return self.stats
+
+    def run(self, output = None, exportFormat = "text", fields = None, timeStep = 1):
+        """
+        Run simulation from begin time to end time, and export the state of every plane
+        at every time step. The states are streamed, so memory use does not grow with
+        the length of the simulation or the number of planes.
+        :param output: file name or (binary) stream to write to, standard output if None.
+        :param exportFormat: one of exportFormats, see TrajectoryWriter.
+        :param fields: list of exportFields to export, all if None.
+        :param timeStep: time between two exported states, > 0.
+        """
+        if output is None:
+            stream = sys.stdout
+        elif isinstance(output, basestring):
+            stream = open(output, 'wb')
+        else:
+            stream = output
+
+        writer = TrajectoryWriter(stream, exportFormat, fields, self.flightPlan.getPlanes())
+        for row in self.iterTrajectory(self.startTime, self.endTime, timeStep):
+            writer.write(row)
+        writer.flush()
+
+        if stream is not output and output is not None:
+            stream.close()
+
+    def iterTrajectory(self, startTime, endTime, timeStep = 1):
         """
-        Run simulation from begin time to end time.     
+        Generate the state of all planes from startTime up to endTime (exclusive) with steps of
+        timeStep, ordered on time and then on plane, as tuples:
+        (time, plane, fuel, coords, numPassengers, passengerKilometers, trip)
+        where trip is None if the plane is not on a trip. States are evaluated in chunks of
+        exportChunkSize times (see getTimeSeries), so memory use is constant.
         """
+        if timeStep <= 0:
+            raise ValueError("Requesting trajectory with time step: " + str(timeStep) + " which is <= 0.")
+
         planes = self.flightPlan.getPlanes()
-        for time in range(self.startTime, self.endTime):
-            simulationLog = self.getSimulationLogAt(time)
-            for plane in planes:
-                planeLog = simulationLog.getPlaneLog(plane)
-                print plane, "time", time, planeLog.getCoords(), planeLog.getFuel()
+        numTimes = int(math.ceil((endTime - startTime) / timeStep))
+
+        for chunkStart in xrange(0, numTimes, exportChunkSize):
+            chunkEnd = min(chunkStart + exportChunkSize, numTimes)
+            timeSeries = self.getTimeSeries(startTime + chunkStart * timeStep,
+                                            startTime + (chunkEnd - 0.5) * timeStep, timeStep)
+            fuel = timeSeries.getFuel()
+            coordsX = timeSeries.getCoordsX()
+            coordsY = timeSeries.getCoordsY()
+            numPassengers = timeSeries.getNumPassengers()
+            passengerKilometers = timeSeries.getPassengerKilometers()
+            tripIndices = timeSeries.getTripIndices()
+            planeTrips = [plane.getTimeline().getTrips() for plane in planes]
+
+            for j, time in enumerate(timeSeries.getTimes()):
+                for i, plane in enumerate(planes):
+                    tripIndex = tripIndices[i, j]
+                    trip = planeTrips[i][tripIndex] if tripIndex >= 0 else None
+                    yield (time, plane, fuel[i, j], (coordsX[i, j], coordsY[i, j]), numPassengers[i, j],
+                           passengerKilometers[i, j], trip)
+
+    def runEvents(self):
+        """
+        Run simulation from begin time to end time, only visiting the moments at which
+        the state of a plane changes (see EventTimeline).
+        """
+        for event in self.getEventTimeline().getEvents(self.startTime, self.endTime):
+            print event
+
+    def getEventTimeline(self):
+        """
+        Get the EventTimeline of the simulation, rebuilt only if the flightplan changed
+        since the last request.
+        """
+        version = self.flightPlan.getVersion()
+        if self.eventTimeline is None or self.eventTimeline.getVersion() != version:
+            self.eventTimeline = EventTimeline(self)
+        return self.eventTimeline
+
+    def getCursor(self, time = None):
+        """
+        Get a new SimulationCursor at time (startTime if None), for playing the simulation.
+        """
+        return SimulationCursor(self, self.startTime if time is None else time)
 
     def getSimulationLogAt(self, time):
         """
         Get the SimulationLog at time. If no SimulationLog exists, one is created.
+        Created SimulationLogs are kept in the frame cache of the simulation.
         As SimulationLog at time i is depended on time i-1, i-1 is also created. Example:
         if time = 300, states at time = 0,1,...,298,299 are created.
         Because of this, this function serves a double purpose as it can also be used to run
@@ -101,14 +275,175 @@ class Simulation(object):
             raise ValueError("Requesting simulationLog at time: " + str(time) +\
                               " which is < 0.")
                
-        return SimulationLog(self, time, self.flightPlan.getPlaneToLogAt(time), self.flightPlan.getConnectionToLogAt(time))
+        version = self.flightPlan.getVersion()
+        if version != self.frameCache.getVersion():
+            self.frameCache.clear(version)
+
+        simulationLog = self.frameCache.get(time)
+        if simulationLog is None:
+            simulationLog = SimulationLog(self, time)
+            self.frameCache.put(time, simulationLog)
+
+        return simulationLog
+
+    def getFrameCache(self):
+        return self.frameCache
+
+    def getDemandMatrixAt(self, time):
+        """
+        Get the remaining demand between all locations at time: the passengers of passengers.txt
+        minus those taken by trips started at or before time.
+        :returns: int array(locations x locations), rows are start locations and columns end
+        locations, ordered as getNetwork().getLocations().
+        """
+        return self.getDemandMatricesAt([time])[0]
+
+    def getDemandMatricesAt(self, times):
+        """
+        Same as getDemandMatrixAt for all times at once.
+        :returns: int array(times x locations x locations).
+        """
+        return self.flightPlan.getDemandIndex().getDemandMatricesAt(self.flightPlan.getNetwork(), times)
+
+    def getNetwork(self):
+        return self.flightPlan.getNetwork()
+
+    def getSeriesTimes(self, startTime, endTime, timeStep = 1):
+        """
+        Get the times of a time series (see getTimeSeries) as a NumPy array, raises a
+        ValueError if they do not lie within the simulation.
+        """
+        if timeStep <= 0:
+            raise ValueError("Requesting time series with time step: " + str(timeStep) + " which is <= 0.")
+        if startTime < 0:
+            raise ValueError("Requesting time series from time: " + str(startTime) + " which is < 0.")
+
+        times = numpy.arange(startTime, endTime, timeStep, dtype = float)
+        if len(times) > 0 and times[-1] > self.endTime:
+            raise ValueError("Requesting time series up to time: " + str(times[-1]) +\
+                              " which is beyond endtime: " + str(self.endTime))
+        return times
+
+    def getTimeSeries(self, startTime, endTime, timeStep = 1, includeConnections = False):
+        """
+        Get the state of all planes (and optionally all connections) from startTime up
+        to endTime with steps of timeStep in one pass, as NumPy arrays. Unlike requesting
+        a SimulationLog for every time, the state of each plane is evaluated from its
+        PlaneTimeline for all times at once.
+        :param startTime: first time of the series, >= 0.
+        :param endTime: end of the series (exclusive), <= endTime of the simulation.
+        :param timeStep: time between two samples, > 0.
+        :param includeConnections: also compute the potential passengers of all connections.
+        :returns: time series with one row per plane (or connection), one column per time.
+        :rtype: SimulationTimeSeries
+        """
+        times = self.getSeriesTimes(startTime, endTime, timeStep)
+
+        planes = self.flightPlan.getPlanes()
+        fuel = numpy.zeros((len(planes), len(times)))
+        coordsX = numpy.zeros((len(planes), len(times)))
+        coordsY = numpy.zeros((len(planes), len(times)))
+        numPassengers = numpy.zeros((len(planes), len(times)), dtype = int)
+        passengerKilometers = numpy.zeros((len(planes), len(times)))
+        tripIndices = numpy.zeros((len(planes), len(times)), dtype = int)
+
+        for i, plane in enumerate(planes):
+            if len(plane.getTrips()) == 0:
+                raise ValueError("No trips planned for plane %s" %(plane))
+
+            fuel[i], coordsX[i], coordsY[i], numPassengers[i], passengerKilometers[i], tripIndices[i] =\
+                plane.getTimeline().getStatesAtTimes(times)
+
+        potentialPassengers = None
+        if includeConnections:
+            potentialPassengers = self.flightPlan.getDemandIndex().getPotentialPassengersAt(
+                                        self.flightPlan.getConnections(), times)
+
+        return SimulationTimeSeries(self, times, planes, fuel, coordsX, coordsY, numPassengers,
+                                     passengerKilometers, tripIndices, potentialPassengers)
 
     def getStartTime(self):
         return self.startTime
     
     def getEndTime(self):
         return self.endTime
+
+    def getNoFlyStart(self):
+        return self.noFlyStart
+
+    def getNoFlyEnd(self):
+        return self.noFlyEnd
+
+    def getHome(self):
+        return self.home
+
+    def getCycles(self):
+        return self.cycles
+
+    def getPeriod(self):
+        return self.period
+
+    def getTotalEndTime(self):
+        """
+        Get the end time of the last cycle, endTime if there is one cycle.
+        """
+        if self.cycles == 1:
+            return self.endTime
+        return self.startTime + self.cycles * self.period
+
+    def getCycleAt(self, time):
+        """
+        Get the cycle (0 for the first) time falls in, and the corresponding time in the first cycle.
+        """
+        cycle = min(int((time - self.startTime) // self.period), self.cycles - 1)
+        return cycle, time - cycle * self.period
+
+    def getPlaneStateAt(self, plane, time):
+        """
+        Get the state of plane at time, in any cycle, as a tuple:
+        (fuel, coords, numPassengers, passengerKilometers, tripIndex)
+        (see PlaneTimeline.getStateAt). The state is taken from the first cycle, after which
+        passenger kilometers are increased by those of every earlier cycle, and fuel is
+        decreased by the fuel that was not refilled in the earlier cycles.
+        """
+        if not self.startTime <= time <= self.getTotalEndTime():
+            raise ValueError("Requesting plane state at time: " + str(time) + " which is outside of the " +\
+                              "simulation: " + str(self.startTime) + " - " + str(self.getTotalEndTime()))
+        if len(plane.getTrips()) == 0:
+            raise ValueError("No trips planned for plane %s" %(plane))
+
+        timeline = plane.getTimeline()
+        cycle, cycleTime = self.getCycleAt(time)
+
+        # the last trip of the previous cycle might still be going on (past midnight).
+        if cycle > 0 and cycleTime + self.period < timeline.getEndTimes()[-1]:
+            cycle -= 1
+            cycleTime += self.period
+
+        fuel, coords, numPassengers, passengerKilometers, tripIndex = timeline.getStateAt(cycleTime)
+        cycleFuel, cyclePassengers, cyclePassengerKilometers = timeline.getTripState(len(timeline.getTrips()))
+        passengerKilometers += cycle * cyclePassengerKilometers
+
+        if cycle > 0:
+            refuelIndex = timeline.getFirstRefuelIndex()
+            if refuelIndex is None:
+                fuel -= cycle * (plane.getMaxFuel() - cycleFuel)
+            elif cycleTime < timeline.getEndTimes()[refuelIndex]:
+                fuel -= plane.getMaxFuel() - cycleFuel
+
+        return fuel, coords, numPassengers, passengerKilometers, tripIndex
+
+    def _isInNoFly(self, time):
+        """
+        Check whether time falls in the no fly zone, of any day if there are multiple cycles.
+        """
+        if self.cycles > 1:
+            time = self.startTime + (time - self.startTime) % minutesPerDay
+        return self.noFlyStart <= time < self.noFlyEnd
     
+    def getFlightPlan(self):
+        return self.flightPlan
+
     def getPlanes(self):
         return self.flightPlan.getPlanes()
     
@@ -128,8 +463,8 @@ class Simulation(object):
         return self.flightPlan.getTrips()
 
     def saveToFiles(self):
-        tripsFile = open(tripsFilePath, 'w')
-        passengersOnTripFile = open(passengersOnTripFilePath, 'w')
+        tripsFile = open(self.tripsFilePath, 'w')
+        passengersOnTripFile = open(self.passengersOnTripFilePath, 'w')
 
         for plane in self.getPlanes():
             for trip in plane.getTrips():
@@ -146,41 +481,76 @@ class Simulation(object):
         passengersOnTripFile.close()
 
     def clearFiles(self):
-        open(tripsFilePath, 'w').close()
-        open(passengersOnTripFilePath, 'w').close()
-
-    def preSimulation(self):
-        self._testPlanes()
-        self._testPassengers()
-        self._testFuel()
-        self._testTrips()
-        
-    def _testPassengers(self):
-        trips = self.flightPlan.getTrips()
-        connectionToPassenger = {}
-        
-        # get all connections which also have a trip.
-        for trip in trips:
-            connections = trip.getPassengerConnections()
-            
-            for connection in connections:
-                connectionToPassenger[connection] = connection.getPotentialPassengers()
-        
-        # calculate number of passengers taken from connections.
-        for trip in trips:
-            connections = trip.getPassengerConnections()
-            
-            for connection in connections:
-                connectionToPassenger[connection] -= trip.getNumPassengersTo(connection.getEndLocation())
-                
-                if connectionToPassenger[connection] < 0:
-                    numPas = connectionToPassenger[connection] + trip.getNumPassengersTo(connection.getEndLocation())
-                    raise ValueError("Illegal passenger subtraction in connection: " + str(connection) +\
-                                      ", tried to subtract " + str(trip.getNumPassengersOn(connection)) +\
-                                       " from " + str(numPas))
+        open(self.tripsFilePath, 'w').close()
+        open(self.passengersOnTripFilePath, 'w').close()
+
+    def preSimulation(self, incremental = False):
+        """
+        Check whether the simulation matches all requirements, raises a ValueError
+        for the first requirement that is not matched.
+        :param incremental: only check planes whose trips changed since the last successful
+        preSimulation, and only the connections whose passengers changed with them.
+        """
+        planes = self.flightPlan.getPlanes()
+        connections = None # all connections
+
+        if incremental:
+            planes = [plane for plane in planes if self.planeToCheckedVersion.get(plane, None) != plane.getVersion()]
+
+            connections = set()
+            for plane in planes:
+                connections |= self.planeToCheckedConnections.get(plane, set())
+                connections |= self._getPassengerConnections(plane)
+
+        self._testPlanes(planes)
+        self._testPassengers(connections)
+        self._testFuel(planes)
+        self._testTrips(planes)
+
+        for plane in planes:
+            self.planeToCheckedVersion[plane] = plane.getVersion()
+            self.planeToCheckedConnections[plane] = self._getPassengerConnections(plane)
+
+    def _getPassengerConnections(self, plane):
+        connections = set()
+        for trip in plane.getTrips():
+            connections.update(trip.getPassengerConnections())
+        return connections
+
+    def _testPassengers(self, connections = None):
+        """
+        Check for connections (all if None) that no more passengers are taken than potential passengers.
+        If all connections are checked the passengers taken are counted again from the trips, so
+        changes to the passengers dictionary of a trip in place are found as well.
+        """
+        demandIndex = self.flightPlan.getDemandIndex(rebuild = connections is None)
+
+        if connections is None:
+            connections = demandIndex.getConnections()
+
+        for connection in connections:
+            if demandIndex.getTotalPassengersTaken(connection) > connection.getPotentialPassengers():
+                self._raisePassengerSubtraction(connection)
+
+    def _raisePassengerSubtraction(self, connection):
+        """ Find the trip which takes more passengers than left on connection and raise. """
+        potentialPassengers = connection.getPotentialPassengers()
+
+        for trip in self.flightPlan.getTrips():
+            numPassengers = trip.getNumPassengersOn(connection)
+
+            if potentialPassengers - numPassengers < 0:
+                raise ValueError("Illegal passenger subtraction in connection: " + str(connection) +\
+                                  ", tried to subtract " + str(numPassengers) +\
+                                   " from " + str(potentialPassengers))
+
+            potentialPassengers -= numPassengers
     
-    def _testPlanes(self):
-        for plane in self.flightPlan.getPlanes():
+    def _testPlanes(self, planes = None):
+        if planes is None:
+            planes = self.flightPlan.getPlanes()
+
+        for plane in planes:
             trips = plane.getTrips()
             
             if len(trips) > 0:
@@ -203,8 +573,7 @@ class Simulation(object):
                     if trip.getStartLocation() == self.home or trip.getEndLocation() == self.home:
                         passedHome = True
                     
-                    if self.noFlyStart <= startTime < self.noFlyEnd or\
-                     self.noFlyStart <= endTime < self.noFlyEnd:
+                    if self._isInNoFly(startTime) or self._isInNoFly(endTime):
                         raise ValueError("Plane: " + str(plane) + " with trip: " + str(trip) +\
                                          " tried to take off or land between noFlyStart: " +\
                                          str(self.noFlyStart) + " and noFlyEnd: " + str(self.noFlyEnd) +\
@@ -221,47 +590,102 @@ class Simulation(object):
                                       str(self.home) + " atleast once.")
                 
                 maxTime += plane.calcTimeTakenOverTrip(endTrip)
+
+                if self.cycles > 1:
+                    self._testCycle(plane, startTrip, endTrip, maxTime)
                 
-                if maxTime > self.endTime:
+                elif maxTime > self.endTime:
                     raise ValueError("Plane: " + str(plane) + " started trip: " + str(endTrip) + " but this trip ends at: " +\
                                      str(maxTime) + " which is beyond end time of simulation: " + str(self.endTime))
                     
-    def _testFuel(self):
-        """" for all planes, calculate fuel after each trip. Check if fuel <0 at any point """
-        for plane in self.flightPlan.getPlanes():
+    def _testCycle(self, plane, startTrip, endTrip, endTime):
+        """
+        Check that endTrip (ending at endTime) of plane ends before startTrip of the next cycle
+        starts, and that the plane carries no passengers at the end of a cycle.
+        """
+        nextStartTime = startTrip.getStartTime() + self.period
+        if endTime > nextStartTime:
+            raise ValueError("Plane: " + str(plane) + " started trip: " + str(endTrip) + " but this trip ends at: " +\
+                             str(endTime) + " which is beyond the start of trip: " + str(startTrip) +\
+                             " in the next cycle at: " + str(nextStartTime))
+
+        fuel, passengers, passengerKilometers = plane.getTimeline().getTripState(len(plane.getTrips()))
+        if sum(passengers.values()) > 0:
+            raise ValueError("Plane: " + str(plane) + " ends a cycle with " + str(sum(passengers.values())) +\
+                             " passengers on board, which would carry over into the next cycle.")
+
+    def _testFuel(self, planes = None):
+        """" for all planes (or planes), calculate fuel after each trip. Check if fuel <0 at any point """
+        if planes is None:
+            planes = self.flightPlan.getPlanes()
+
+        for plane in planes:
             fuel = plane.getFuelAt(self.startTime)
-            
-            for trip in plane.getTrips():
-                fuel -= trip.getDistance()
-                
-                if fuel < 0:
-                    raise ValueError("Fuel for plane: " + str(plane) + " reached <0 on trip:  " + str(trip))
-                
-                if trip.getRefuel():
-                    fuel = plane.getFuelAt(0)
+            trips = plane.getTrips()
+
+            # all cycles after the first start with the same fuel if the plane refuels, else
+            # fuel decreases every cycle, so the first cycle in which it runs out is known.
+            cycle = 0
+            if self.cycles > 1 and len(trips) > 0 and not any(trip.getRefuel() for trip in trips):
+                cycleDistance = sum(trip.getDistance() for trip in trips)
+                cycle = min(int(fuel // cycleDistance), self.cycles - 1)
+                fuel -= cycle * cycleDistance
+
+            for cycle in range(cycle, min(cycle + 2, self.cycles)):
+                for trip in trips:
+                    fuel -= trip.getDistance()
+                    
+                    if fuel < 0:
+                        inCycle = " in cycle: " + str(cycle + 1) if self.cycles > 1 else ""
+                        raise ValueError("Fuel for plane: " + str(plane) + " reached <0 on trip:  " + str(trip) + inCycle)
+                    
+                    if trip.getRefuel():
+                        fuel = plane.getFuelAt(0)
     
-    def _testTrips(self):
-        planes = self.flightPlan.getPlanes()
+    def _testTrips(self, planes = None):
+        if planes is None:
+            planes = self.flightPlan.getPlanes()
         
         for plane in planes:
-            trips = plane.getTrips()
-            tripStartEnd = []            
-        
-            for trip in trips:
+            collisions = self.getTripCollisions(plane, collectAll = False)
+
+            if len(collisions) > 0:
+                plane, trip1, (start1, end1), trip2, (start2, end2) = collisions[0]
+                raise ValueError("Trip collision occured with plane: " + str(plane) + " between trip: " +\
+                                  str(trip1.getName()) + " (" + str(start1) + " - " + str(end1) + ") and trip: " +\
+                                  str(trip2.getName()) + " (" + str(start2) + " - " + str(end2) + ")")
+
+    def getTripCollisions(self, plane = None, collectAll = True):
+        """
+        Find all pairs of trips of a plane (all planes if None) that take place at the same time,
+        including ground time. The trips are swept in order of start time, keeping a heap of the
+        trips that have not ended yet, which takes O(n log n + collisions) per plane.
+        :param collectAll: if False, stop at the first collision found.
+        :returns: list of tuples (plane, trip1, (start1, end1), trip2, (start2, end2)), trip1
+        starts before (or at the same time as) trip2.
+        """
+        planes = self.flightPlan.getPlanes() if plane is None else [plane]
+        collisions = []
+
+        for plane in planes:
+            activeTrips = [] # heap of (end, start, trip) of trips that have not ended yet.
+
+            for trip in plane.getTrips():
                 start = trip.getStartTime()
                 end = start + plane.calcTimeTakenOverTrip(trip)
-                tripStartEnd += [(start, end)]
-            
-            allTripIndexes = range(len(tripStartEnd))
-            for i in allTripIndexes:
-                start, end = tripStartEnd[i]
-                restTripIndexes = allTripIndexes[:] # copy
-                del restTripIndexes[i]
-                
-                for j in restTripIndexes:
-                    startCheck, endCheck = tripStartEnd[j]
-                    if (startCheck >= start > endCheck) or (startCheck < end <= endCheck) or (start < endCheck <= end):
-                        raise ValueError("Trip collision occured with plane: " + str(plane))
+
+                while len(activeTrips) > 0 and activeTrips[0][0] <= start:
+                    heapq.heappop(activeTrips)
+
+                for activeEnd, activeStart, activeTrip in sorted(activeTrips, key = lambda active : active[1]):
+                    collisions.append((plane, activeTrip, (activeStart, activeEnd), trip, (start, end)))
+
+                    if not collectAll:
+                        return collisions
+
+                heapq.heappush(activeTrips, (end, start, trip))
+
+        return collisions
     
     def _removeEmptyLinesAtEnd(self, data):
         """ Helper function, removes [''] entries at the end of data which should
@@ -272,26 +696,26 @@ class Simulation(object):
         return data
 
     def _loadData(self):
-        locationsFile = open(locationsFilePath)
+        locationsFile = open(self.locationsFilePath)
         self._interpretLocations(locationsFile.read())
         locationsFile.close()
         
-        configFile = open(configFilePath)
+        configFile = open(self.configFilePath)
         self._interpretConfig(configFile.read())
         configFile.close()
         
-        connectionsFile = open(connectionsFilePath)
-        passengersFile = open(passengersFilePath)
+        connectionsFile = open(self.connectionsFilePath)
+        passengersFile = open(self.passengersFilePath)
         self._interpretConnections(connectionsFile.read(), passengersFile.read())
         connectionsFile.close()
         passengersFile.close()
         
-        planesFile = open(planesFilePath)
+        planesFile = open(self.planesFilePath)
         self._interpretPlanes(planesFile.read())
         planesFile.close()
         
-        tripsFile = open(tripsFilePath)
-        passengersOnTripFile = open(passengersOnTripFilePath)
+        tripsFile = open(self.tripsFilePath)
+        passengersOnTripFile = open(self.passengersOnTripFilePath)
         self._interpretTrips(tripsFile.read(), passengersOnTripFile.read())
         tripsFile.close()
         passengersOnTripFile.close()
@@ -311,13 +735,19 @@ class Simulation(object):
                 
             elif setting == "noflyend":
                 self.noFlyEnd = int(value)
+
+            elif setting == "cycles":
+                self.cycles = int(value)
+
+            elif setting == "period":
+                self.period = int(value)
                 
             elif setting == "home":
                 location = self.flightPlan.getLocationByName(value)
                 if location != None:
                     self.home = location
                 else:
-                    raise ValueError("Unknown location: " + value + " set as home in " + configFilePath)
+                    raise ValueError("Unknown location: " + value + " set as home in " + self.configFilePath)
            
     def _interpretLocations(self, locationsString):
         locationsList = self._removeEmptyLinesAtEnd([line.split(",") for line in locationsString.split("\n")])
@@ -330,15 +760,25 @@ class Simulation(object):
         idToLocation = {}
         for location in self.flightPlan.getLocations():
             idToLocation[location.getId()] = location
-                    
+
+        # the i-th row/column of both matrices belongs to the location with id i.
+        locations = []
         for i in range(len(connectionsList)):
-            for j in range(len(connectionsList[i])):
-                startLocation = idToLocation[i]
-                endLocation = idToLocation[j]
-                if startLocation != endLocation:
-                    connection = Connection(startLocation, endLocation, connectionsList[i][j], passengersList[i][j])
-                    self.flightPlan.addConnection(connection)
-                    startLocation.addConnection(connection)
+            if i not in idToLocation:
+                raise ValueError("No location with id: " + str(i) + " for row " + str(i) + " in " + self.connectionsFilePath)
+            locations.append(idToLocation[i])
+
+        # the diagonal (from a location to itself) is not a connection and is ignored.
+        distances = [[int(distance) if i != j else 0 for j, distance in enumerate(row)]
+                      for i, row in enumerate(connectionsList)]
+        potentialPassengers = [[int(numPassengers) if i != j else 0 for j, numPassengers in enumerate(row)]
+                                for i, row in enumerate(passengersList)]
+
+        network = Network(locations, distances, potentialPassengers)
+        self.flightPlan.setNetwork(network)
+
+        for connection in network.getConnections():
+            connection.getStartLocation().addConnection(connection)
 
     def _interpretPlanes(self, planesString):
         planesList = self._removeEmptyLinesAtEnd([line.split(',') for line in planesString.split("\n")])
@@ -361,23 +801,23 @@ class Simulation(object):
   
             endLocation = self.flightPlan.getLocationByName(endLocationName)            
             if endLocation is None:
-                raise ValueError("Unknown location: " + endLocationName + " in " + passengersOnTripFilePath)
+                raise ValueError("Unknown location: " + endLocationName + " in " + self.passengersOnTripFilePath)
             
             endLocationToNumPassengers = tripNameToEndLocationToNumPassengers.get(tripName, {})     
             if endLocationToNumPassengers.get(endLocation, None) != None:
                 raise ValueError("Trip: " + tripName + " is mentioned twice with the same end location: " +\
-                                  endLocationName + " in " + passengersOnTripFilePath)
+                                  endLocationName + " in " + self.passengersOnTripFilePath)
                 
             endLocationToNumPassengers[endLocation] = int(numPassengers)
             tripNameToEndLocationToNumPassengers[tripName] = endLocationToNumPassengers
         
-        unknownTripNames = tripNameToEndLocationToNumPassengers.keys()
-        knownTripNames = []
+        unknownTripNames = set(tripNameToEndLocationToNumPassengers.keys())
+        knownTripNames = set()
         
         for tripName, startTime, planeName, origin, destination, refuel in tripsList:
             plane = nameToPlane.get(planeName, None)
             if plane is None:
-                raise ValueError("Unknown plane: " + str(planeName) + " in " + tripsFilePath)
+                raise ValueError("Unknown plane: " + str(planeName) + " in " + self.tripsFilePath)
         
             startLocation = self.flightPlan.getLocationByName(origin)
             endLocation = self.flightPlan.getLocationByName(destination)
@@ -388,16 +828,12 @@ class Simulation(object):
             if connection is None:
                 raise ValueError("Connection between: " + str(origin) + ", " + str(destination) + " does not exist.")
             
-            # easier to ask for forgiveness than permission
-            try:
-                unknownTripNames.remove(tripName)
-            except ValueError:
-                pass
+            unknownTripNames.discard(tripName)
             
             if tripName in knownTripNames:
-                raise ValueError("Duplicate trip name in " + tripsFilePath)
+                raise ValueError("Duplicate trip name in " + self.tripsFilePath)
             
-            knownTripNames.append(tripName)
+            knownTripNames.add(tripName)
             endLocationToNumPassengers = tripNameToEndLocationToNumPassengers.get(tripName, {})
             
             passengers = {}
@@ -406,14 +842,14 @@ class Simulation(object):
                 
                 if passengerConnection is None:
                     raise ValueError("No known connection between: " + str(startLocation) + " and: " +\
-                                     str(passengerEndLocation) + " specified in " + str(passengersOnTripFilePath))
+                                     str(passengerEndLocation) + " specified in " + str(self.passengersOnTripFilePath))
                 
                 passengers[passengerConnection] = endLocationToNumPassengers[passengerEndLocation]
             
             plane.addTrip(Trip(tripName, startTime, connection, passengers, int(refuel)))
         
         if len(unknownTripNames) > 0:
-            raise ValueError("Unknown trip names: " + str(unknownTripNames) + " in " + passengersOnTripFilePath)
+            raise ValueError("Unknown trip names: " + str(sorted(unknownTripNames)) + " in " + self.passengersOnTripFilePath)
             
 
 class SimulationLog(object):
@@ -430,13 +866,22 @@ class SimulationLog(object):
     and values all planeLogs in the simulation.
     - connectionToLog dict(Connection:ConnectionLog), dictionary with keys alls connection
     in the simulation and values all simulationLogs in the simulation.
+    The log is lazy: a PlaneLog or ConnectionLog is only created (and then kept) once it
+    is requested. Requesting planeToLog or connectionToLog creates all of them.
+    As with PlaneLogs, a SimulationLog is no longer valid once the simulation is modified.
     """
     
-    def __init__(self, simulation, time, planeToLog, connectionToLog):
+    def __init__(self, simulation, time, planeToLog = None, connectionToLog = None):
         self.simulation = simulation
         self.time = time
-        self.planeToLog = planeToLog
-        self.connectionToLog = connectionToLog
+        self.flightPlan = simulation.getFlightPlan()
+
+        # if complete dictionaries of logs are given, nothing has to be created.
+        self.hasAllPlaneLogs = planeToLog is not None
+        self.hasAllConnectionLogs = connectionToLog is not None
+        self.planeToLog = planeToLog if planeToLog is not None else {}
+        self.connectionToLog = connectionToLog if connectionToLog is not None else {}
+        self.demandIndex = None # DemandIndex of the flightplan, fetched once a ConnectionLog is created.
         
     def getSimulation(self):
         return self.simulation
@@ -445,131 +890,837 @@ class SimulationLog(object):
         return self.time
     
     def getPlaneLog(self, plane):
-        return self.planeToLog.get(plane, None)
+        planeLog = self.planeToLog.get(plane, None)
+
+        if planeLog is None and not self.hasAllPlaneLogs and plane.getFlightPlan() is self.flightPlan:
+            planeLog = plane.getPlaneLogAt(self.time)
+            self.planeToLog[plane] = planeLog
+
+        return planeLog
+
+    def getConnectionLog(self, connection):
+        connectionLog = self.connectionToLog.get(connection, None)
+
+        if connectionLog is None and not self.hasAllConnectionLogs and connection.getFlightPlan() is self.flightPlan:
+            if self.demandIndex is None:
+                self.demandIndex = self.flightPlan.getDemandIndex()
+
+            connectionLog = self.demandIndex.getConnectionLogAt(connection, self.time)
+            self.connectionToLog[connection] = connectionLog
+
+        return connectionLog
 
     def getPlaneToLog(self):
+        if not self.hasAllPlaneLogs:
+            for plane in self.flightPlan.getPlanes():
+                self.getPlaneLog(plane)
+            self.hasAllPlaneLogs = True
+
         return self.planeToLog
     
     def getConnectionToLog(self):
+        if not self.hasAllConnectionLogs:
+            for connection in self.flightPlan.getConnections():
+                self.getConnectionLog(connection)
+            self.hasAllConnectionLogs = True
+
         return self.connectionToLog
     
     def getPlanes(self):
-        return self.planeToLog.keys()
+        return self.getPlaneToLog().keys()
     
     def getConnections(self):
-        return self.connectionToLog.keys()
+        return self.getConnectionToLog().keys()
 
     def getPlaneLogs(self):
-        return self.planeToLog.values()
+        return self.getPlaneToLog().values()
     
     def getConnectionLogs(self):
-        return self.connectionToLog.values()
+        return self.getConnectionToLog().values()
 
-class FlightPlan(object):
-    def __init__(self):
-        self.planes = []
-        self.connections = []
-        self.locations = []
-        self.nameToLocations = {}
-        
-    def addLocation(self, location):
-        if location.getName() not in self.nameToLocations:
-            self.locations.append(location)
-            self.nameToLocations[location.getName()] = location
-        else:
-            raise ValueError("Duplicate location name with name: %s" %(location.getName()))
-            
-    def addLocations(self, locations):
-        for location in locations:
-            self.addLocation(location)
-            
-    def getLocations(self):
-        return self.locations
-    
-    def getLocationByName(self, name):
-        return self.nameToLocations.get(name, None)
-    
-    def printLocations(self):
-        print ', '.join([str(location) for location in self.locations])
-    
-    def addConnection(self, connection):
-        if connection not in self.connections:
-            self.connections.append(connection)
-        else:
-            raise ValueError("Connection: " + str(connection) + " already exists in the flightplan.")
-     
-    def addConnections(self, connections):
-        for connection in connections:
-            self.addConnection(connection)
+class FrameCache(object):
+    """
+    Least recently used cache of SimulationLogs (frames) by time, for one version of
+    the flightplan. If the cache holds maxSize frames, adding a frame evicts the frame
+    that was used longest ago. A maxSize of 0 disables the cache.
+    Keeps count of hits, misses and evictions.
+    """
 
-    def addPlane(self, plane):
-        if plane not in self.planes:
-            self.planes.append(plane)
+    def __init__(self, maxSize):
+        if maxSize < 0:
+            raise ValueError("Frame cache size: " + str(maxSize) + " is < 0.")
+
+        self.maxSize = maxSize
+        self.version = None
+        self.timeToFrame = collections.OrderedDict() # least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, time):
+        """
+        Get the frame at time, None if it is not in the cache.
+        """
+        frame = self.timeToFrame.pop(time, None)
+
+        if frame is None:
+            self.misses += 1
         else:
-            raise ValueError("Plane: " + str(plane) + " already exists in the flightplan.")
-        
-    def addPlanes(self, planes):
-        for plane in planes:
-            self.addPlane(plane)
-    
-    def getConnections(self):
-        return self.connections
-          
-    def getConnectionsByStart(self, startLocation):
-        return filter(lambda connection : connection.getStartLocation() == startLocation, self.connections)
+            self.timeToFrame[time] = frame # move to the back, it is now most recently used.
+            self.hits += 1
 
-    def getConnectionsByEnd(self, endLocation):
-        return filter(lambda connection : connection.getEndLocation() == endLocation, self.connections)
+        return frame
 
-    def getPlanes(self):
-        return self.planes
-    
-    def getConnectionToLogAt(self, time):
-        return {con : con.getConnectionLogAt(time, self.planes) for con in self.connections}
-    
-    def getPlaneToLogAt(self, time):
-        return {plane : plane.getPlaneLogAt(time) for plane in self.planes}
+    def put(self, time, frame):
+        if self.maxSize == 0:
+            return
 
-    def getTrips(self):
-        trips = []
-        for plane in self.planes:
-            trips += plane.getTrips()
-        return trips
+        self.timeToFrame.pop(time, None)
+        self.timeToFrame[time] = frame
 
-class Plane(object):
+        while len(self.timeToFrame) > self.maxSize:
+            self.timeToFrame.popitem(last = False)
+            self.evictions += 1
+
+    def clear(self, version = None):
+        """
+        Remove all frames, frames added hereafter belong to version.
+        """
+        self.timeToFrame.clear()
+        self.version = version
+
+    def getVersion(self):
+        return self.version
+
+    def getMaxSize(self):
+        return self.maxSize
+
+    def setMaxSize(self, maxSize):
+        if maxSize < 0:
+            raise ValueError("Frame cache size: " + str(maxSize) + " is < 0.")
+
+        self.maxSize = maxSize
+        while len(self.timeToFrame) > self.maxSize:
+            self.timeToFrame.popitem(last = False)
+            self.evictions += 1
+
+    def getSize(self):
+        return len(self.timeToFrame)
+
+    def getHits(self):
+        return self.hits
+
+    def getMisses(self):
+        return self.misses
+
+    def getEvictions(self):
+        return self.evictions
+
+class SimulationTimeSeries(object):
     """
-    Representation of a plane, which can travel over planned trips.
+    State of a simulation over a range of times, stored as NumPy arrays.
+    Contains:
+    - simulation Simulation
+    - times array(float), the sampled times.
+    - planes list(Plane), plane i corresponds to row i of all plane arrays.
+    - fuel, coordsX, coordsY, numPassengers, passengerKilometers array(planes x times).
+    - tripIndices array(planes x times), index of the current trip in plane.getTrips(),
+    -1 if the plane is not on a trip.
+    - connections list(Connection), connection i corresponds to row i of potentialPassengers.
+    - potentialPassengers array(connections x times), None if connections were not requested.
     """
-    
-    def __init__(self, name, maxPassengers, planeType, home, speed, maxFuel):
-        self.name = str(name)
-        self.maxPassengers = int(maxPassengers)
-        self.planeType = str(planeType)
-        self.speed = int(speed)
-        self.maxFuel = int(maxFuel)
-        self.home = home
-        self.trips = {} # startTimeToTrip
-        self.timeToPlaneLog = {}
-        
-    def __str__(self):
-        return self.name
-        
-    def addTrip(self, trip):
-        if trip.getTotalNumPassengers() > self.maxPassengers:
-            raise ValueError("Plane: " + str(self) + " cannot carry more than " + str(self.maxPassengers) +\
-                              " Passengers, requested: " + str(trip.getTotalNumPassengers()))
-        
-        startTime = trip.getStartTime()
-        self.trips[startTime] = trip
-        
-    def removeTrip(self, trip):
-        startTime = trip.getStartTime()
-        if trip is self.trips[startTime]:
-            del self.trips[startTime]
-            return True
+
+    def __init__(self, simulation, times, planes, fuel, coordsX, coordsY, numPassengers,
+                  passengerKilometers, tripIndices, potentialPassengers = None):
+        self.simulation = simulation
+        self.times = times
+        self.planes = planes
+        self.fuel = fuel
+        self.coordsX = coordsX
+        self.coordsY = coordsY
+        self.numPassengers = numPassengers
+        self.passengerKilometers = passengerKilometers
+        self.tripIndices = tripIndices
+        self.potentialPassengers = potentialPassengers
+
+    def getSimulation(self):
+        return self.simulation
+
+    def getTimes(self):
+        return self.times
+
+    def getPlanes(self):
+        return self.planes
+
+    def getPlaneIndex(self, plane):
+        return self.planes.index(plane)
+
+    def getConnections(self):
+        return self.simulation.getConnections()
+
+    def getFuel(self):
+        return self.fuel
+
+    def getCoordsX(self):
+        return self.coordsX
+
+    def getCoordsY(self):
+        return self.coordsY
+
+    def getNumPassengers(self):
+        return self.numPassengers
+
+    def getPassengerKilometers(self):
+        return self.passengerKilometers
+
+    def getTripIndices(self):
+        return self.tripIndices
+
+    def getPotentialPassengers(self):
+        return self.potentialPassengers
+
+class TrajectoryWriter(object):
+    """
+    Buffered writer of the rows of Simulation.iterTrajectory to a stream in one of the formats:
+    - text, one readable line per row.
+    - csv, a header line followed by comma separated rows.
+    - jsonl, one JSON object per row.
+    - binary, little endian, starting with "MKTR", a uint32 length and a JSON header
+    {"fields" : fields, "planes" : plane names, "trips" : trip names per plane}, followed by
+    packed rows: time (double), plane index (uint16) and per field: coords (2 doubles),
+    fuel (double), passengers (int32), passengerkilometers (double), trip (int32, index
+    of the trip in the trips of the plane, -1 if none). See readBinaryTrajectory.
+    In all formats but binary, trip is the name of the trip (empty or null if none).
+    """
+
+    bufferSize = 4096 # number of rows buffered before writing to the stream.
+    fieldToStructFormat = {"coords" : "dd", "fuel" : "d", "passengers" : "i",
+                           "passengerkilometers" : "d", "trip" : "i"}
+
+    def __init__(self, stream, exportFormat, fields, planes):
+        if exportFormat not in exportFormats:
+            raise ValueError("Unknown export format: " + str(exportFormat) + ", choose from: " + str(exportFormats))
+
+        fields = list(exportFields) if fields is None else list(fields)
+        for field in fields:
+            if field not in exportFields:
+                raise ValueError("Unknown export field: " + str(field) + ", choose from: " + str(exportFields))
+
+        self.stream = stream
+        self.exportFormat = exportFormat
+        self.fields = fields
+        self.planeToIndex = dict((plane, i) for i, plane in enumerate(planes))
+        self.planeToTripIndex = dict((plane, dict((trip, i) for i, trip in enumerate(plane.getTrips())))\
+                                      for plane in planes)
+        self.buffer = []
+        self.rowStruct = struct.Struct("<dH" + "".join(self.fieldToStructFormat[field] for field in fields))
+
+        if exportFormat == "csv":
+            columns = ["time", "plane"]
+            for field in fields:
+                columns += ["x", "y"] if field == "coords" else [field]
+            self.buffer.append(",".join(columns) + "\n")
+        elif exportFormat == "binary":
+            header = json.dumps({"fields" : fields, "planes" : [plane.getName() for plane in planes],
+                                 "trips" : [[trip.getName() for trip in plane.getTrips()] for plane in planes]})
+            self.buffer.append("MKTR" + struct.pack("<I", len(header)) + header)
+
+    def getFields(self):
+        return self.fields
+
+    def getFormat(self):
+        return self.exportFormat
+
+    def write(self, row):
+        time, plane, fuel, coords, numPassengers, passengerKilometers, trip = row
+        fieldToValue = {"coords" : (float(coords[0]), float(coords[1])), "fuel" : float(fuel),
+                        "passengers" : int(numPassengers), "passengerkilometers" : float(passengerKilometers),
+                        "trip" : trip}
+        time = int(time) if time == int(time) else float(time)
+
+        if self.exportFormat == "binary":
+            values = [time, self.planeToIndex[plane]]
+            for field in self.fields:
+                if field == "coords":
+                    values.extend(fieldToValue[field])
+                elif field == "trip":
+                    values.append(-1 if trip is None else self.planeToTripIndex[plane][trip])
+                else:
+                    values.append(fieldToValue[field])
+            self.buffer.append(self.rowStruct.pack(*values))
+
+        elif self.exportFormat == "jsonl":
+            record = {"time" : time, "plane" : plane.getName()}
+            for field in self.fields:
+                value = fieldToValue[field]
+                if field == "trip":
+                    value = None if trip is None else trip.getName()
+                record[field] = value
+            self.buffer.append(json.dumps(record, sort_keys = True) + "\n")
+
+        else:
+            values = []
+            for field in self.fields:
+                value = fieldToValue[field]
+                if field == "trip":
+                    value = "" if trip is None else trip.getName()
+                if field == "coords" and self.exportFormat == "csv":
+                    values.extend(repr(coordinate) for coordinate in value)
+                else:
+                    values.append(repr(value) if isinstance(value, float) else str(value))
+
+            if self.exportFormat == "csv":
+                self.buffer.append(",".join([str(time), plane.getName()] + values) + "\n")
+            else:
+                self.buffer.append(" ".join([plane.getName(), "time", str(time)] + values).rstrip() + "\n")
+
+        if len(self.buffer) >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        self.stream.write("".join(self.buffer))
+        self.buffer = []
+
+def readBinaryTrajectory(stream):
+    """
+    Generate the rows written by a TrajectoryWriter in the binary format as dictionaries
+    {"time" : time, "plane" : plane name, field : value}, with the trip as its name (None if none).
+    """
+    if stream.read(4) != "MKTR":
+        raise ValueError("Stream does not contain a binary trajectory.")
+
+    headerLength = struct.unpack("<I", stream.read(4))[0]
+    header = json.loads(stream.read(headerLength))
+    fields = header["fields"]
+    rowStruct = struct.Struct("<dH" + "".join(TrajectoryWriter.fieldToStructFormat[field] for field in fields))
+
+    while True:
+        data = stream.read(rowStruct.size)
+        if len(data) < rowStruct.size:
+            return
+
+        values = list(rowStruct.unpack(data))
+        planeIndex = values[1]
+        row = {"time" : values[0], "plane" : header["planes"][planeIndex]}
+        position = 2
+        for field in fields:
+            if field == "coords":
+                row[field] = (values[position], values[position + 1])
+                position += 2
+            else:
+                row[field] = values[position]
+                if field == "trip":
+                    row[field] = None if values[position] < 0 else header["trips"][planeIndex][values[position]]
+                position += 1
+        yield row
+
+class SimulationEvent(object):
+    """
+    A moment at which the state of a plane changes, one of:
+    - takeoffEvent, the plane starts trip, the passengers of trip have boarded.
+    - landingEvent, the plane lands at the end location of trip.
+    - passengersDroppedEvent, passengers for the end location of trip have left the plane.
+    - refuelEvent, the plane is refueled (only for trips with refuel).
+    - readyEvent, trip is over, the plane is ready for its next trip.
+    As in the frame based simulation, the plane is busy on a trip until the end of the
+    ground time, so the last three events all take place at the end time of trip.
+    Contains the state of the plane right after the event:
+    - fuel, passengers {connection:numPassengers}, passengerKilometers
+    - connectionToPotentialPassengers, the new potential passengers of every connection
+    changed by the event (passengers boarding at takeoff), empty for other events.
+    """
+
+    __slots__ = ("time", "eventType", "plane", "trip", "fuel", "passengers", "passengerKilometers",
+                 "connectionToPotentialPassengers")
+
+    def __init__(self, time, eventType, plane, trip, fuel, passengers, passengerKilometers):
+        self.time = time
+        self.eventType = eventType
+        self.plane = plane
+        self.trip = trip
+        self.fuel = fuel
+        self.passengers = passengers
+        self.passengerKilometers = passengerKilometers
+        self.connectionToPotentialPassengers = {}
+
+    def __str__(self):
+        return "%s time %s %s trip %s fuel %s passengers %d" %(self.plane, self.time, self.eventType,
+                self.trip.getName(), self.fuel, self.getNumPassengers())
+
+    def getTime(self):
+        return self.time
+
+    def getType(self):
+        return self.eventType
+
+    def getPlane(self):
+        return self.plane
+
+    def getTrip(self):
+        return self.trip
+
+    def getFuel(self):
+        return self.fuel
+
+    def getPassengers(self):
+        return self.passengers
+
+    def getNumPassengers(self):
+        return sum(self.passengers.values())
+
+    def getPassengerKilometers(self):
+        return self.passengerKilometers
+
+    def getConnectionToPotentialPassengers(self):
+        return self.connectionToPotentialPassengers
+
+class EventTimeline(object):
+    """
+    Event driven alternative to the frames of a simulation: the ordered stream of all
+    SimulationEvents of all planes (on time, events of the same plane in order of
+    occurrence). The state of a plane or connection at any time is that of its last event
+    at or before that time, only fuel and coordinates of a plane in the air are
+    interpolated. Building the timeline and looking up a state thus scale with the number
+    of trips, not with the number of minutes and planes. The logs are equal to those of
+    the frames of the simulation, also if trips of a plane overlap: as in the frames a plane
+    is on its last started trip, so events of a trip after the next trip starts are left out.
+    The timeline is only valid for the version of the flightplan it was built from.
+    """
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.flightPlan = simulation.getFlightPlan()
+        self.version = self.flightPlan.getVersion()
+        self.planeToEvents = {}
+        self.planeToEventTimes = {}
+        self.connectionToTimes = {}
+        self.connectionToPotentialPassengers = {}
+
+        keyedEvents = []
+        for planeIndex, plane in enumerate(self.flightPlan.getPlanes()):
+            events = self._createPlaneEvents(plane)
+            self.planeToEvents[plane] = events
+            self.planeToEventTimes[plane] = [event.getTime() for event in events]
+            keyedEvents.append([(event.getTime(), planeIndex, order, event) for order, event in enumerate(events)])
+
+        self.events = [keyedEvent[-1] for keyedEvent in heapq.merge(*keyedEvents)]
+        self.eventTimes = [event.getTime() for event in self.events]
+
+        # carry the potential passengers of the connections over the events.
+        potentialPassengers = {}
+        for event in self.events:
+            if event.getType() != takeoffEvent:
+                continue
+
+            for connection, numPassengers in event.getTrip().getPassengers().items():
+                potential = potentialPassengers.get(connection, connection.getPotentialPassengers()) - numPassengers
+                potentialPassengers[connection] = potential
+                event.connectionToPotentialPassengers[connection] = potential
+                self.connectionToTimes.setdefault(connection, []).append(event.getTime())
+                self.connectionToPotentialPassengers.setdefault(connection, []).append(potential)
+
+    def _createPlaneEvents(self, plane):
+        events = []
+        if len(plane.getTrips()) == 0:
+            return events
+
+        timeline = plane.getTimeline()
+        trips = timeline.getTrips()
+        for index, trip in enumerate(trips):
+            tripEvents = []
+            fuel, passengers, passengerKilometers = timeline.getTripState(index)
+            endFuel, endPassengers, endPassengerKilometers = timeline.getTripState(index + 1)
+            passengers = plane._combinePassengers(passengers, trip.getPassengers())
+            endTime = trip.getEndTime(plane)
+
+            tripEvents.append(SimulationEvent(trip.getStartTime(), takeoffEvent, plane, trip, fuel,
+                                               passengers, passengerKilometers))
+            tripEvents.append(SimulationEvent(trip.getEndTimeWithoutGroundTime(plane), landingEvent, plane, trip,
+                                               fuel - trip.getDistance(), passengers, passengerKilometers))
+            tripEvents.append(SimulationEvent(endTime, passengersDroppedEvent, plane, trip,
+                                               fuel - trip.getDistance(), endPassengers, endPassengerKilometers))
+            if trip.getRefuel():
+                tripEvents.append(SimulationEvent(endTime, refuelEvent, plane, trip,
+                                                   endFuel, endPassengers, endPassengerKilometers))
+            tripEvents.append(SimulationEvent(endTime, readyEvent, plane, trip,
+                                               endFuel, endPassengers, endPassengerKilometers))
+
+            # trips of a valid plan end before the next starts, so this only cuts overlapping trips.
+            if index + 1 < len(trips):
+                nextStartTime = trips[index + 1].getStartTime()
+                tripEvents = [event for event in tripEvents if event.getTime() <= nextStartTime]
+            events += tripEvents
+
+        return events
+
+    def getVersion(self):
+        return self.version
+
+    def getEvents(self, startTime = None, endTime = None, plane = None):
+        """
+        Get all events with startTime <= time < endTime in order, of all planes or of plane.
+        """
+        if plane is None:
+            events, eventTimes = self.events, self.eventTimes
+        else:
+            events, eventTimes = self.planeToEvents[plane], self.planeToEventTimes[plane]
+
+        start = 0 if startTime is None else bisect.bisect_left(eventTimes, startTime)
+        end = len(events) if endTime is None else bisect.bisect_left(eventTimes, endTime)
+        return events[start:end]
+
+    def getEventTimes(self):
+        return self.eventTimes
+
+    def getLastEvent(self, plane, time):
+        """
+        Get the last event of plane at or before time, None if its first trip has not started.
+        """
+        index = bisect.bisect_right(self.planeToEventTimes[plane], time)
+        if index == 0:
+            return None
+        return self.planeToEvents[plane][index - 1]
+
+    def getPlaneLogAt(self, plane, time):
+        return self.createPlaneLog(plane, self.getLastEvent(plane, time), time)
+
+    def createPlaneLog(self, plane, event, time):
+        """
+        Create the PlaneLog of plane at time, given its last event at or before time (None if
+        its first trip has not started).
+        """
+        if len(self.planeToEvents[plane]) == 0:
+            raise ValueError("No trips planned for plane %s" %(plane))
+
+        # no trips took place at time, plane is waiting at the start of its first trip.
+        if event is None:
+            coords = plane.calculatePlaneCoords(time, self.planeToEvents[plane][0].getTrip())
+            return PlaneLog(plane, {}, time, plane.getMaxFuel(), coords, None, passengerKilometers = 0)
+
+        trip = event.getTrip()
+        coords = plane.calculatePlaneCoords(time, trip)
+        fuel = event.getFuel()
+
+        # plane is in the air, interpolate fuel since takeoff.
+        if event.getType() == takeoffEvent:
+            fuel -= (time - trip.getStartTime()) * (plane.getSpeed() / 60)
+
+        currentTrip = None if event.getType() == readyEvent else trip
+        return PlaneLog(plane, dict(event.getPassengers()), time, fuel, coords, currentTrip,
+                         passengerKilometers = event.getPassengerKilometers())
+
+    def getConnectionLogAt(self, connection, time):
+        times = self.connectionToTimes.get(connection, None)
+        index = 0 if times is None else bisect.bisect_right(times, time)
+
+        if index == 0:
+            potentialPassengers = connection.getPotentialPassengers()
+        else:
+            potentialPassengers = self.connectionToPotentialPassengers[connection][index - 1]
+
+        return ConnectionLog(connection, time, potentialPassengers)
+
+    def getSimulationLogAt(self, time):
+        """
+        Get a complete SimulationLog at time, built from the events.
+        """
+        planeToLog = dict((plane, self.getPlaneLogAt(plane, time)) for plane in self.flightPlan.getPlanes())
+        connectionToLog = dict((connection, self.getConnectionLogAt(connection, time))\
+                                for connection in self.flightPlan.getConnections())
+        return SimulationLog(self.simulation, time, planeToLog, connectionToLog)
+
+class SimulationCursor(object):
+    """
+    A position in time in a simulation, holding the state of all planes (their last event)
+    and connections (their potential passengers) at that time. Moving the cursor forward
+    only applies the events in between (see EventTimeline), so playing the simulation step
+    by step costs O(1) amortized per plane per step. Moving it back restores the nearest
+    checkpoint, taken every cursorCheckpointInterval events, and replays from there.
+    If the flightplan changes, the cursor starts over from the new EventTimeline.
+    """
+
+    def __init__(self, simulation, time):
+        self.simulation = simulation
+        self.time = time
+        self._reset()
+        self.seek(time)
+
+    def _reset(self):
+        self.eventTimeline = self.simulation.getEventTimeline()
+        self.events = self.eventTimeline.getEvents()
+        self.eventIndex = 0 # number of events applied.
+        self.planeToEvent = {}
+        self.connectionToPotentialPassengers = {}
+        self.checkpoints = []
+        self._addCheckpoint()
+
+    def _addCheckpoint(self):
+        self.checkpoints.append((self.eventIndex, dict(self.planeToEvent), dict(self.connectionToPotentialPassengers)))
+
+    def _applyEventsUpTo(self, time):
+        events = self.events
+        while self.eventIndex < len(events) and events[self.eventIndex].getTime() <= time:
+            event = events[self.eventIndex]
+            self.planeToEvent[event.getPlane()] = event
+            self.connectionToPotentialPassengers.update(event.getConnectionToPotentialPassengers())
+            self.eventIndex += 1
+
+            if self.eventIndex % cursorCheckpointInterval == 0 and\
+                    self.eventIndex // cursorCheckpointInterval == len(self.checkpoints):
+                self._addCheckpoint()
+
+    def seek(self, time):
+        """
+        Move the cursor to time, forward or backward.
+        """
+        if self.simulation.getEventTimeline() is not self.eventTimeline:
+            self._reset()
+
+        if time < self.time:
+            # number of events at or before time, restore the last checkpoint not beyond them.
+            numEvents = bisect.bisect_right(self.eventTimeline.getEventTimes(), time)
+            checkpoint = self.checkpoints[min(numEvents // cursorCheckpointInterval, len(self.checkpoints) - 1)]
+            self.eventIndex = checkpoint[0]
+            self.planeToEvent = dict(checkpoint[1])
+            self.connectionToPotentialPassengers = dict(checkpoint[2])
+
+        self._applyEventsUpTo(time)
+        self.time = time
+
+    def advance(self, timeStep = 1):
+        """
+        Move the cursor timeStep forward.
+        """
+        self.seek(self.time + timeStep)
+
+    def getTime(self):
+        return self.time
+
+    def getSimulation(self):
+        return self.simulation
+
+    def getPlaneLog(self, plane):
+        return self.eventTimeline.createPlaneLog(plane, self.planeToEvent.get(plane, None), self.time)
+
+    def getConnectionLog(self, connection):
+        potentialPassengers = self.connectionToPotentialPassengers.get(connection, connection.getPotentialPassengers())
+        return ConnectionLog(connection, self.time, potentialPassengers)
+
+    def getSimulationLog(self):
+        """
+        Get the SimulationLog at the time of the cursor, with the logs of all planes. Logs of
+        connections are still created lazily, when requested.
+        """
+        planeToLog = dict((plane, self.getPlaneLog(plane)) for plane in self.simulation.getPlanes())
+        return SimulationLog(self.simulation, self.time, planeToLog)
+
+class FlightPlan(object):
+    def __init__(self):
+        self.planes = []
+        self.connections = []
+        self.locations = []
+        self.nameToLocations = {}
+        self.network = None
+        self.connectionKeys = set() # (startLocation, endLocation) of all connections
+        self.startLocationToConnections = {}
+        self.endLocationToConnections = {}
+        self.version = 0 # incremented when planes are added, see getVersion.
+        self.demandIndex = None # DemandIndex, (re)built lazily in getDemandIndex.
+        self.tripTable = None # TripTable, (re)built lazily in getTripTable.
+        self.demandLedger = DemandLedger() # seats reserved per connection by all trips of all planes.
+        self.stats = None # SimulationStats of the simulation of this flightplan while it is instrumented.
+        
+    def addLocation(self, location):
+        if location.getName() not in self.nameToLocations:
+            self.locations.append(location)
+            self.nameToLocations[location.getName()] = location
+        else:
+            raise ValueError("Duplicate location name with name: %s" %(location.getName()))
+            
+    def addLocations(self, locations):
+        for location in locations:
+            self.addLocation(location)
+            
+    def getLocations(self):
+        return self.locations
+    
+    def getLocationByName(self, name):
+        return self.nameToLocations.get(name, None)
+    
+    def printLocations(self):
+        print ', '.join([str(location) for location in self.locations])
+    
+    def setNetwork(self, network):
+        """
+        Set the network of the flightplan and add all its connections.
+        """
+        self.network = network
+        self.addConnections(network.getConnections())
+
+    def getNetwork(self):
+        return self.network
+
+    def addConnection(self, connection):
+        startLocation, endLocation = connection.getLocations()
+
+        if (startLocation, endLocation) not in self.connectionKeys:
+            self.connections.append(connection)
+            self.connectionKeys.add((startLocation, endLocation))
+            self.startLocationToConnections.setdefault(startLocation, []).append(connection)
+            self.endLocationToConnections.setdefault(endLocation, []).append(connection)
+            connection.setFlightPlan(self)
+        else:
+            raise ValueError("Connection: " + str(connection) + " already exists in the flightplan.")
+     
+    def addConnections(self, connections):
+        for connection in connections:
+            self.addConnection(connection)
+
+    def addPlane(self, plane):
+        if plane not in self.planes:
+            self.demandLedger.reserveTrips(plane.getTrips())
+            self.planes.append(plane)
+            plane.setFlightPlan(self)
+            self.version += 1
+        else:
+            raise ValueError("Plane: " + str(plane) + " already exists in the flightplan.")
+        
+    def addPlanes(self, planes):
+        for plane in planes:
+            self.addPlane(plane)
+    
+    def getConnections(self):
+        return self.connections
+          
+    def getConnectionsByStart(self, startLocation):
+        return list(self.startLocationToConnections.get(startLocation, []))
+
+    def getConnectionsByEnd(self, endLocation):
+        return list(self.endLocationToConnections.get(endLocation, []))
+
+    def getPlanes(self):
+        return self.planes
+    
+    def getVersion(self):
+        """
+        Version of the flightplan, changes whenever a plane is added or the trips of
+        any plane are changed (see Plane.markChanged).
+        """
+        return self.version + sum(plane.getVersion() for plane in self.planes)
+
+    def getDemandIndex(self, rebuild = False):
+        """
+        Get the DemandIndex over all planes in the flightplan. The index is only
+        rebuilt if the flightplan changed since the last request, or if rebuild is True
+        (changes to the passengers dictionary of a trip in place do not change the version).
+        """
+        version = self.getVersion()
+        if rebuild or self.demandIndex is None or self.demandIndex.getVersion() != version:
+            self.demandIndex = DemandIndex(self.planes, version)
+        return self.demandIndex
+
+    def getDemandLedger(self):
+        return self.demandLedger
+
+    def getTripTable(self):
+        """
+        Get the TripTable of all trips in the flightplan. The table is only rebuilt if the
+        flightplan changed since the last request.
+        """
+        version = self.getVersion()
+        if self.tripTable is None or self.tripTable.getVersion() != version:
+            self.tripTable = TripTable(self, version)
+        return self.tripTable
+
+    def getConnectionToLogAt(self, time):
+        demandIndex = self.getDemandIndex()
+        return {con : demandIndex.getConnectionLogAt(con, time) for con in self.connections}
+    
+    def getPlaneToLogAt(self, time):
+        return {plane : plane.getPlaneLogAt(time) for plane in self.planes}
+
+    def getTrips(self):
+        trips = []
+        for plane in self.planes:
+            trips += plane.getTrips()
+        return trips
+
+class Plane(object):
+    """
+    Representation of a plane, which can travel over planned trips.
+    """
+    
+    def __init__(self, name, maxPassengers, planeType, home, speed, maxFuel):
+        self.name = str(name)
+        self.maxPassengers = int(maxPassengers)
+        self.planeType = str(planeType)
+        self.speed = int(speed)
+        self.maxFuel = int(maxFuel)
+        self.home = home
+        self.trips = TripStore() # trips ordered on start time.
+        self.timeToPlaneLog = {}
+        self.version = 0 # incremented on every change to the trips of this plane.
+        self.timeline = None # PlaneTimeline, (re)built lazily in getPlaneLogAt.
+        self.flightPlan = None # the flightplan this plane is added to, None if not added.
+        
+    def __str__(self):
+        return self.name
+
+    def setFlightPlan(self, flightPlan):
+        self.flightPlan = flightPlan
+
+    def getFlightPlan(self):
+        return self.flightPlan
+
+    def checkCapacity(self, passengers):
+        """
+        Check that passengers {connection:numPassengers} fit in this plane, raises a ValueError if not.
+        """
+        numPassengers = sum(passengers.values())
+        if numPassengers > self.maxPassengers:
+            raise ValueError("Plane: " + str(self) + " cannot carry more than " + str(self.maxPassengers) +\
+                              " Passengers, requested: " + str(numPassengers))
+        
+    def addTrip(self, trip):
+        """
+        Add trip to this plane. If the plane is in a flightplan, the seats of its passengers are
+        reserved in the DemandLedger of the flightplan, which raises if too few passengers are left.
+        Raises a ValueError if the plane already has a trip starting at the same time.
+        """
+        self.checkCapacity(trip.getPassengers())
+
+        sameStartTrip = self.trips.getTripStartingAt(trip.getStartTime())
+        if sameStartTrip is not None:
+            raise ValueError("Plane: " + str(self) + " already has trip: " + str(sameStartTrip) +\
+                             " starting at: " + str(trip.getStartTime()) + ", cannot add trip: " + str(trip))
+
+        if self.flightPlan is not None:
+            self.flightPlan.getDemandLedger().reserve(trip.getPassengers())
+
+        self.trips.add(trip)
+        trip.setPlane(self)
+        self.markChanged()
+        
+    def removeTrip(self, trip):
+        if self.trips.remove(trip):
+            trip.setPlane(None)
+            if self.flightPlan is not None:
+                self.flightPlan.getDemandLedger().release(trip.getPassengers())
+            self.markChanged()
+            return True
         else:
             return False
 
+    def markChanged(self):
+        """
+        Mark the trips of this plane as changed, invalidating all cached state.
+        Called by addTrip, removeTrip, Trip.setRefuel and Trip.setPassengers.
+        """
+        self.version += 1
+
+    def getVersion(self):
+        return self.version
+
     def getCoordsAt(self, time):
         return self.getPlaneLogAt(time).getCoords()
     
@@ -585,61 +1736,18 @@ class Plane(object):
     def getPlaneLogAt(self, time):
         """
         Get a PlaneLog of this plane at time.
+        The state of the plane is looked up in its PlaneTimeline, which is rebuilt
+        only if the trips of this plane changed since the last request.
         """
         if len(self.trips) == 0:
             raise ValueError("No trips planned for plane %s" %(self))
 
-        # find all trips that have taken place plus the one taking place (if there is one)
-        tripsSorted = sorted(self.trips.values(), key = lambda trip : trip.getStartTime())
-        trips = filter(lambda trip : time >= trip.getStartTime(), tripsSorted)
-
-        currentTrip = None # the trip the plane is undertaking right now at time.
-        passengers = {}
-        fuel = self.maxFuel
-        passengerKilometers = 0
-
-        # if no trips took place at time, set coords (to start coords). 
-        # else: calculate new coords, adjust fuel etc.
-        if len(trips) == 0:
-            coords = self.calculatePlaneCoords(time, tripsSorted[0])
-        else:
-            coords = self.calculatePlaneCoords(time, trips[-1])
-
-            # for all trips that took place at time, substract fuel.
-            for trip in trips[:-1]:
-                if trip.getRefuel():
-                    fuel = self.maxFuel
-                else:
-                    fuel -= trip.getDistance()
-
-                passengers = self._combinePassengers(passengers, trip.getPassengers())
-
-                passengerKilometers += self.removePassengers(passengers, trip.getEndLocation())
-
-            # the last trip, which might take place right now at time.
-            trip = trips[-1]
-            passengers = self._combinePassengers(passengers, trip.getPassengers())
-
-            # if plane is in air at time, update fuel depending on distance.
-            if time < trip.getEndTimeWithoutGroundTime(self):
-                fuel -= (time - trip.getStartTime()) * (self.speed / 60)
-                currentTrip = trip
-            
-            # if plane is still busy on a trip, but not in air adjust fuel.
-            elif time < trip.getEndTime(self):
-                fuel -= trip.getDistance()
-                currentTrip = trip
-
-            # else plane has finished last trip, check if it has refueled and adjust fuel.
-            else:
-                if trip.getRefuel():
-                    fuel = self.maxFuel
-                else:
-                    fuel -= trip.getDistance()
+        return self.getTimeline().getPlaneLogAt(time)
 
-                passengerKilometers += self.removePassengers(passengers, trip.getEndLocation())
-        
-        return PlaneLog(self, passengers, time, fuel, coords, currentTrip, passengerKilometers = passengerKilometers)
+    def getTimeline(self):
+        if self.timeline is None or self.timeline.getVersion() != self.version:
+            self.timeline = PlaneTimeline(self)
+        return self.timeline
 
     def calculatePlaneCoords(self, time, trip):
         connection  =   trip.getConnection()
@@ -655,18 +1763,23 @@ class Plane(object):
             return endCoords
 
         else:
-            x       =   endCoords[0] - startCoords[0]
-            y       =   endCoords[1] - startCoords[1]
-            alpha   =   math.atan2(y, x)
-            
-            # Pythagoras, hurray!
-            actualDistance = math.sqrt(x**2 + y**2)
-            
+            cosAlpha, sinAlpha = connection.getDirection()
             speed = (self.speed / 60) * (time - startTime)
-            actualSpeed = (speed / distance) * actualDistance # coords do not match the distance in trips, hence actualSpeed
+            actualSpeed = (speed / distance) * connection.getCoordsDistance() # coords do not match the distance in trips, hence actualSpeed
 
             # x_i, y_i = x_(i-1) + speed * cos(alpha), y_(i-1)  speed * sin(alpha)
-            return (startCoords[0] + actualSpeed * math.cos(alpha), startCoords[1] + actualSpeed * math.sin(alpha))
+            return (startCoords[0] + actualSpeed * cosAlpha, startCoords[1] + actualSpeed * sinAlpha)
+
+    def getCoordsAtTimes(self, times):
+        """
+        Get the coordinates of this plane at all times (any order, any resolution) at once.
+        :param times: list or array of times.
+        :returns: array of x coordinates and array of y coordinates.
+        """
+        if len(self.trips) == 0:
+            raise ValueError("No trips planned for plane %s" %(self))
+
+        return self.getTimeline().getCoordsAtTimes(times)
 
     def removePassengers(self, passengers, endLocation):
         passengerKilometers = 0
@@ -701,10 +1814,8 @@ class Plane(object):
               for connection in set(passengers1)|set(passengers2))
         
     def _getTripWithStartBetween(self, lowerbound, upperbound):
-        for startTime in self.trips:
-            if lowerbound <= startTime < upperbound:
-                return self.trips[startTime]
-        return None
+        trips = self.trips.getTripsBetween(lowerbound, upperbound)
+        return trips[0] if len(trips) > 0 else None
     
     def _arrivedAt(self, endLocation, passengers):
         passengerKilometers = 0
@@ -721,7 +1832,23 @@ class Plane(object):
         return self.maxFuel
             
     def getTrips(self):
-        return [self.trips[startTime] for startTime in sorted(self.trips)]
+        """ Get all trips of this plane, ordered on start time. """
+        return self.trips.getTrips()
+
+    def getTripStartingAt(self, startTime):
+        return self.trips.getTripStartingAt(startTime)
+
+    def getPreviousTrip(self, time):
+        """ Get the last trip starting before time, None if there is none. """
+        return self.trips.getPreviousTrip(time)
+
+    def getNextTrip(self, time):
+        """ Get the first trip starting after time, None if there is none. """
+        return self.trips.getNextTrip(time)
+
+    def getTripsBetween(self, startTime, endTime):
+        """ Get the trips starting from startTime up to endTime (exclusive), ordered on start time. """
+        return self.trips.getTripsBetween(startTime, endTime)
     
     def getName(self):
         return self.name
@@ -744,6 +1871,331 @@ class Plane(object):
             time += waitAtRefuel
         return time # int(time + 0.5)
 
+class PlaneTimeline(object):
+    """
+    Precomputed states of a plane over all its trips (in order of start time).
+    For every trip the state of the plane just before that trip starts is stored,
+    plus the state after the last trip:
+    - fuel in km
+    - passengers on board {connection:numPassengers} and their total number
+    - passenger kilometers made so far
+    A PlaneLog at any time is then found by a bisect over the start times of the trips,
+    after which only the trip taking place at that time has to be replayed.
+    The timeline is only valid for the version of the plane it was built from.
+    Note: changing the passengers dictionary of a trip in place is not tracked.
+    """
+
+    def __init__(self, plane):
+        self.plane = plane
+        self.version = plane.getVersion()
+        self.trips = plane.getTrips()
+        self.startTimes = [trip.getStartTime() for trip in self.trips]
+        self.landTimes = [trip.getEndTimeWithoutGroundTime(plane) for trip in self.trips]
+        self.endTimes = [trip.getEndTime(plane) for trip in self.trips]
+        self.fuels = []
+        self.passengers = []
+        self.numPassengers = []
+        self.passengerKilometers = []
+
+        fuel = plane.getMaxFuel()
+        passengers = {}
+        passengerKilometers = 0
+
+        # replay all trips once, in the same order (and thus with the same rounding) as a full replay.
+        for trip in self.trips:
+            self._addState(fuel, passengers, passengerKilometers)
+
+            if trip.getRefuel():
+                fuel = plane.getMaxFuel()
+            else:
+                fuel -= trip.getDistance()
+
+            passengers = plane._combinePassengers(passengers, trip.getPassengers())
+            passengerKilometers += plane.removePassengers(passengers, trip.getEndLocation())
+
+        self._addState(fuel, passengers, passengerKilometers)
+        self.arrays = None # NumPy arrays of the timeline, built lazily in _getArrays.
+
+    def _addState(self, fuel, passengers, passengerKilometers):
+        self.fuels.append(fuel)
+        self.passengers.append(passengers)
+        self.numPassengers.append(sum(passengers.values()))
+        self.passengerKilometers.append(passengerKilometers)
+
+    def getVersion(self):
+        return self.version
+
+    def getTrips(self):
+        return self.trips
+
+    def getStartTimes(self):
+        return self.startTimes
+
+    def getLandTimes(self):
+        return self.landTimes
+
+    def getEndTimes(self):
+        return self.endTimes
+
+    def getFirstRefuelIndex(self):
+        """
+        Get the index of the first trip that refuels, None if no trip refuels.
+        """
+        for index, trip in enumerate(self.trips):
+            if trip.getRefuel():
+                return index
+        return None
+
+    def getTripState(self, index):
+        """
+        Get the state of the plane just before trip index starts (index == number of trips:
+        after the last trip) as a tuple (fuel, passengers, passengerKilometers).
+        """
+        return self.fuels[index], self.passengers[index], self.passengerKilometers[index]
+
+    def findTripIndex(self, time):
+        """
+        Get the number of trips that have started at time. The trip taking place
+        at time (if any) is thus the trip with index findTripIndex(time) - 1.
+        """
+        return bisect.bisect_right(self.startTimes, time)
+
+    def advanceTripIndex(self, time, index):
+        """
+        Same as findTripIndex, but starts searching from index, a trip index at an
+        earlier time. Cheap when time is increased in small steps.
+        """
+        numTrips = len(self.startTimes)
+        while index < numTrips and self.startTimes[index] <= time:
+            index += 1
+        return index
+
+    def getPlaneLogAt(self, time, index = None):
+        """
+        Get a PlaneLog of the plane at time. If the index of the trip is already
+        known (see findTripIndex) it can be passed to skip the bisect.
+        """
+        plane = self.plane
+
+        if index is None:
+            index = self.findTripIndex(time)
+
+        # no trips took place at time, plane is waiting at the start of its first trip.
+        if index == 0:
+            coords = plane.calculatePlaneCoords(time, self.trips[0])
+            return PlaneLog(plane, {}, time, plane.getMaxFuel(), coords, None, passengerKilometers = 0)
+
+        # the last trip, which might take place right now at time.
+        trip = self.trips[index - 1]
+        coords = plane.calculatePlaneCoords(time, trip)
+
+        # plane has finished last trip, its state is the state after that trip.
+        if time >= self.endTimes[index - 1]:
+            return PlaneLog(plane, dict(self.passengers[index]), time, self.fuels[index], coords, None,
+                             passengerKilometers = self.passengerKilometers[index])
+
+        fuel = self.fuels[index - 1]
+        passengers = plane._combinePassengers(self.passengers[index - 1], trip.getPassengers())
+
+        # if plane is in air at time, update fuel depending on distance.
+        if time < self.landTimes[index - 1]:
+            fuel -= (time - trip.getStartTime()) * (plane.getSpeed() / 60)
+
+        # else plane is still busy on a trip, but not in air adjust fuel.
+        else:
+            fuel -= trip.getDistance()
+
+        return PlaneLog(plane, passengers, time, fuel, coords, trip,
+                         passengerKilometers = self.passengerKilometers[index - 1])
+
+    def _getArrays(self):
+        """
+        Get the timeline (and the trajectory of every trip) as a dictionary of NumPy arrays,
+        used to evaluate many times at once.
+        """
+        if self.arrays is None:
+            connections = [trip.getConnection() for trip in self.trips]
+            startCoords = numpy.array([connection.getStartLocation().getCoords() for connection in connections], dtype = float)
+            endCoords = numpy.array([connection.getEndLocation().getCoords() for connection in connections], dtype = float)
+            directions = numpy.array([connection.getDirection() for connection in connections], dtype = float)
+
+            self.arrays = {
+                "startTimes" : numpy.array(self.startTimes, dtype = float),
+                "landTimes" : numpy.array(self.landTimes, dtype = float),
+                "endTimes" : numpy.array(self.endTimes, dtype = float),
+                "distances" : numpy.array([connection.getDistance() for connection in connections], dtype = float),
+                "coordsDistances" : numpy.array([connection.getCoordsDistance() for connection in connections], dtype = float),
+                "startX" : startCoords[:, 0], "startY" : startCoords[:, 1],
+                "endX" : endCoords[:, 0], "endY" : endCoords[:, 1],
+                "cosAlpha" : directions[:, 0], "sinAlpha" : directions[:, 1],
+                "tripPassengers" : numpy.array([trip.getTotalNumPassengers() for trip in self.trips], dtype = int),
+                "fuels" : numpy.array(self.fuels, dtype = float),
+                "numPassengers" : numpy.array(self.numPassengers, dtype = int),
+                "passengerKilometers" : numpy.array(self.passengerKilometers, dtype = float)
+            }
+
+        return self.arrays
+
+    def getCoordsAtTimes(self, times):
+        """
+        Get the coordinates of the plane at all times, same as calculatePlaneCoords of the
+        plane for every time, but evaluated for all times at once.
+        :returns: array of x coordinates and array of y coordinates.
+        """
+        arrays = self._getArrays()
+        times = numpy.asarray(times, dtype = float)
+
+        # trip the plane is on (or has last been on), the first trip if none started yet.
+        tripIndices = numpy.maximum(numpy.searchsorted(arrays["startTimes"], times, side = "right") - 1, 0)
+        elapsed = times - arrays["startTimes"][tripIndices]
+        distances = arrays["distances"][tripIndices]
+
+        speed = (self.plane.getSpeed() / 60) * elapsed
+        actualSpeed = (speed / distances) * arrays["coordsDistances"][tripIndices]
+        coordsX = arrays["startX"][tripIndices] + actualSpeed * arrays["cosAlpha"][tripIndices]
+        coordsY = arrays["startY"][tripIndices] + actualSpeed * arrays["sinAlpha"][tripIndices]
+
+        notStarted = elapsed < 0
+        coordsX[notStarted] = arrays["startX"][tripIndices][notStarted]
+        coordsY[notStarted] = arrays["startY"][tripIndices][notStarted]
+
+        arrived = distances / self.plane.getSpeed() * 60 < elapsed
+        coordsX[arrived] = arrays["endX"][tripIndices][arrived]
+        coordsY[arrived] = arrays["endY"][tripIndices][arrived]
+
+        return coordsX, coordsY
+
+    def getStatesAtTimes(self, times):
+        """
+        Get the state of the plane at all times at once, same as getStateAt for every time.
+        :returns: arrays fuel, coordsX, coordsY, numPassengers, passengerKilometers, tripIndices.
+        """
+        arrays = self._getArrays()
+        times = numpy.asarray(times, dtype = float)
+        coordsX, coordsY = self.getCoordsAtTimes(times)
+
+        counts = numpy.searchsorted(arrays["startTimes"], times, side = "right")
+        indices = numpy.maximum(counts - 1, 0) # index of the last started trip (0 if none started)
+        started = counts > 0
+        inAir = started & (times < arrays["landTimes"][indices])
+        onGround = started & ~inAir & (times < arrays["endTimes"][indices])
+        onTrip = inAir | onGround
+
+        # plane has finished its last trip (or not started any), its state is the state at counts.
+        fuel = arrays["fuels"][counts]
+        numPassengers = arrays["numPassengers"][counts]
+        passengerKilometers = arrays["passengerKilometers"][counts]
+        tripIndices = numpy.where(onTrip, indices, -1)
+
+        elapsed = times - arrays["startTimes"][indices]
+        fuel = numpy.where(inAir, arrays["fuels"][indices] - elapsed * (self.plane.getSpeed() / 60), fuel)
+        fuel = numpy.where(onGround, arrays["fuels"][indices] - arrays["distances"][indices], fuel)
+        numPassengers = numpy.where(onTrip, arrays["numPassengers"][indices] + arrays["tripPassengers"][indices],
+                                     numPassengers)
+        passengerKilometers = numpy.where(onTrip, arrays["passengerKilometers"][indices], passengerKilometers)
+
+        return fuel, coordsX, coordsY, numPassengers, passengerKilometers, tripIndices
+
+    def getStateAt(self, time, index = None):
+        """
+        Get the state of the plane at time without building a PlaneLog, as a tuple:
+        (fuel, coords, numPassengers, passengerKilometers, tripIndex)
+        where tripIndex is the index of the current trip in getTrips(), -1 if no trip.
+        """
+        plane = self.plane
+
+        if index is None:
+            index = self.findTripIndex(time)
+
+        if index == 0:
+            return plane.getMaxFuel(), plane.calculatePlaneCoords(time, self.trips[0]), 0, 0, -1
+
+        trip = self.trips[index - 1]
+        coords = plane.calculatePlaneCoords(time, trip)
+
+        if time >= self.endTimes[index - 1]:
+            return self.fuels[index], coords, self.numPassengers[index], self.passengerKilometers[index], -1
+
+        if time < self.landTimes[index - 1]:
+            fuel = self.fuels[index - 1] - (time - trip.getStartTime()) * (plane.getSpeed() / 60)
+        else:
+            fuel = self.fuels[index - 1] - trip.getDistance()
+
+        numPassengers = self.numPassengers[index - 1] + trip.getTotalNumPassengers()
+        return fuel, coords, numPassengers, self.passengerKilometers[index - 1], index - 1
+
+class TripTable(object):
+    """
+    Columnar view of all trips of a flightplan, ordered on plane and then on start time. Every
+    column is a NumPy array with one entry per trip (see getColumnNames):
+    - plane, index of the plane of the trip in getPlanes()
+    - starttime, landtime, endtime, of the flight and of the ground time after it
+    - distance, refuel, startlocation, endlocation (indices in the network of the flightplan)
+    - passengers, boarding the trip. onboard, on board during the trip
+    - maxpassengers, capacity of the plane
+    - fuelbefore, fuelafter, fuel before the trip and after the trip (and refueling)
+    - passengerkilometers, made by the passengers leaving the plane at the end of the trip
+    The table is only valid for the version of the flightplan it was built from.
+    """
+
+    def __init__(self, flightPlan, version = None):
+        self.version = version
+        self.planes = flightPlan.getPlanes()
+        self.trips = []
+        network = flightPlan.getNetwork()
+        rows = []
+
+        for planeIndex, plane in enumerate(self.planes):
+            if len(plane.getTrips()) == 0:
+                continue
+
+            timeline = plane.getTimeline()
+            for index, trip in enumerate(timeline.getTrips()):
+                fuel, passengers, passengerKilometers = timeline.getTripState(index)
+                endFuel, endPassengers, endPassengerKilometers = timeline.getTripState(index + 1)
+                numPassengers = trip.getTotalNumPassengers()
+                startIndex, endIndex = trip.getConnection().getIndices()
+
+                self.trips.append(trip)
+                rows.append((planeIndex, trip.getStartTime(), timeline.getLandTimes()[index], timeline.getEndTimes()[index],
+                             trip.getDistance(), trip.getRefuel(), startIndex, endIndex, numPassengers,
+                             sum(passengers.values()) + numPassengers, plane.getMaxPassengers(), fuel, endFuel,
+                             endPassengerKilometers - passengerKilometers))
+
+        rows = numpy.array(rows, dtype = float).reshape((len(rows), len(self.columnNames)))
+        self.columns = {}
+        for i, name in enumerate(self.columnNames):
+            column = rows[:, i]
+            if name in self.integerColumnNames:
+                column = column.astype(int)
+            elif name == "refuel":
+                column = column.astype(bool)
+            self.columns[name] = column
+
+    columnNames = ["plane", "starttime", "landtime", "endtime", "distance", "refuel", "startlocation", "endlocation",
+                   "passengers", "onboard", "maxpassengers", "fuelbefore", "fuelafter", "passengerkilometers"]
+    integerColumnNames = ["plane", "distance", "startlocation", "endlocation", "passengers", "onboard", "maxpassengers"]
+
+    def getVersion(self):
+        return self.version
+
+    def getPlanes(self):
+        return self.planes
+
+    def getTrips(self):
+        return self.trips
+
+    def getNumTrips(self):
+        return len(self.trips)
+
+    def getColumnNames(self):
+        return list(self.columnNames)
+
+    def getColumn(self, name):
+        if name not in self.columns:
+            raise ValueError("Unknown column: " + str(name) + ", choose from: " + str(self.columnNames))
+        return self.columns[name]
+
 class PlaneLog(object):
     """
     State of a plane at a given time (blackbox).
@@ -764,6 +2216,7 @@ class PlaneLog(object):
         self.trip = trip
         self.passengerKilometers = passengerKilometers
         self.passengers = passengers # {connection:numPassengers}
+        self.endLocationToNumPassengers = None # built on the first call of getNumPassengersTo.
         
     def getPlane(self):
         return self.plane
@@ -793,15 +2246,75 @@ class PlaneLog(object):
         return self.passengers.get(connection, 0)
     
     def getNumPassengersTo(self, endLocation):
-        connectionsTo = []
-        for connection in self.passengers.keys():
-            if endLocation == connection.getEndLocation():
-                connectionsTo.append(connection)
-        return sum([self.passengers.get(connection, 0) for connection in connectionsTo])
+        if self.endLocationToNumPassengers is None:
+            self.endLocationToNumPassengers = {}
+            for connection, numPassengers in self.passengers.items():
+                connectionEnd = connection.getEndLocation()
+                self.endLocationToNumPassengers[connectionEnd] = self.endLocationToNumPassengers.get(connectionEnd, 0) +\
+                                                                  numPassengers
+        return self.endLocationToNumPassengers.get(endLocation, 0)
     
     def getTotalNumPassengers(self):
         return sum(self.passengers.values())
 
+class TripStore(object):
+    """
+    The trips of a plane, kept ordered on start time in a list next to a list of their start
+    times, so trips are added, removed and looked up by time with a binary search.
+    """
+
+    def __init__(self):
+        self.startTimes = []
+        self.trips = []
+
+    def __len__(self):
+        return len(self.trips)
+
+    def __iter__(self):
+        return iter(self.trips)
+
+    def add(self, trip):
+        """ Add trip, raises a ValueError if a trip with the same start time is stored. """
+        startTime = trip.getStartTime()
+        index = bisect.bisect_left(self.startTimes, startTime)
+        if index < len(self.startTimes) and self.startTimes[index] == startTime:
+            raise ValueError("Trip: " + str(trip) + " starts at the same time as trip: " + str(self.trips[index]))
+
+        self.startTimes.insert(index, startTime)
+        self.trips.insert(index, trip)
+
+    def remove(self, trip):
+        """ Remove trip, returns False if trip is not stored. """
+        index = bisect.bisect_left(self.startTimes, trip.getStartTime())
+        if index < len(self.trips) and self.trips[index] is trip:
+            del self.startTimes[index]
+            del self.trips[index]
+            return True
+        return False
+
+    def getTrips(self):
+        return list(self.trips)
+
+    def getStartTimes(self):
+        return list(self.startTimes)
+
+    def getTripStartingAt(self, startTime):
+        index = bisect.bisect_left(self.startTimes, startTime)
+        if index < len(self.startTimes) and self.startTimes[index] == startTime:
+            return self.trips[index]
+        return None
+
+    def getPreviousTrip(self, time):
+        index = bisect.bisect_left(self.startTimes, time)
+        return self.trips[index - 1] if index > 0 else None
+
+    def getNextTrip(self, time):
+        index = bisect.bisect_right(self.startTimes, time)
+        return self.trips[index] if index < len(self.trips) else None
+
+    def getTripsBetween(self, startTime, endTime):
+        return self.trips[bisect.bisect_left(self.startTimes, startTime):bisect.bisect_left(self.startTimes, endTime)]
+
 class Trip(object):
     def __init__(self, name, startTime, connection, passengers, refuel):
         self.name = name
@@ -809,6 +2322,8 @@ class Trip(object):
         self.connection = connection
         self.refuel = bool(refuel)
         self.passengers = passengers # connection to number of passengers
+        self.endLocationToNumPassengers = self._indexPassengers(passengers)
+        self.plane = None # the plane this trip is added to, None if not added.
         
     def __str__(self):
         return "starttime: " + str(self.startTime) + ", " + str(self.connection)
@@ -816,6 +2331,42 @@ class Trip(object):
     def setRefuel(self, refuel):
         self.refuel = bool(refuel)
 
+        if self.plane is not None:
+            self.plane.markChanged()
+
+    def setPassengers(self, passengers):
+        """
+        Replace the passengers {connection:numPassengers} of this trip. If the trip is added to a
+        plane, its capacity is checked and the seats are exchanged in the DemandLedger of its
+        flightplan, which raises (leaving the trip unchanged) if too few passengers are left.
+        Note: changing the passengers dictionary of a trip in place is not tracked.
+        """
+        if self.plane is not None:
+            self.plane.checkCapacity(passengers)
+
+            flightPlan = self.plane.getFlightPlan()
+            if flightPlan is not None:
+                flightPlan.getDemandLedger().reserve(passengers, self.passengers)
+
+        self.passengers = passengers
+        self.endLocationToNumPassengers = self._indexPassengers(passengers)
+
+        if self.plane is not None:
+            self.plane.markChanged()
+
+    def _indexPassengers(self, passengers):
+        endLocationToNumPassengers = {}
+        for connection, numPassengers in passengers.items():
+            endLocation = connection.getEndLocation()
+            endLocationToNumPassengers[endLocation] = endLocationToNumPassengers.get(endLocation, 0) + numPassengers
+        return endLocationToNumPassengers
+
+    def setPlane(self, plane):
+        self.plane = plane
+
+    def getPlane(self):
+        return self.plane
+
     def getName(self):
         return self.name
 
@@ -857,67 +2408,371 @@ class Trip(object):
         return self.passengers.get(connection, 0)
     
     def getNumPassengersTo(self, endLocation):
-        connectionsTo = []
-        for connection in self.passengers.keys():
-            if endLocation == connection.getEndLocation():
-                connectionsTo.append(connection)
-        return sum([self.passengers.get(connection, 0) for connection in connectionsTo])
+        return self.endLocationToNumPassengers.get(endLocation, 0)
     
     def getTotalNumPassengers(self):
         return sum(self.passengers.values())
     
     def getPassengerEndLocations(self):
-        return [connection.GetEndLocation() for connection in self.passengers.keys()]
+        return self.endLocationToNumPassengers.keys()
     
     def getPassengerConnections(self):
         return self.passengers.keys()
             
+class Network(object):
+    """
+    All locations and the connections between every ordered pair of them.
+    The distances and potential passengers between locations are stored as NumPy
+    matrices, where row/column i belongs to location i in locations. Every Connection
+    is a lightweight view on these matrices, indexed by (startIndex, endIndex).
+    Contains:
+    - locations list(Location), location i belongs to row/column i.
+    - distances array(int) locations x locations
+    - potentialPassengers array(int) locations x locations
+    - connections list(Connection), all connections, ordered by (startIndex, endIndex).
+    """
+
+    def __init__(self, locations, distances, potentialPassengers):
+        self.locations = list(locations)
+        self.distances = numpy.array(distances, dtype = int)
+        self.potentialPassengers = numpy.array(potentialPassengers, dtype = int)
+
+        numLocations = len(self.locations)
+        if self.distances.shape != (numLocations, numLocations) or\
+           self.potentialPassengers.shape != (numLocations, numLocations):
+            raise ValueError("Distances and passengers must be " + str(numLocations) + " x " + str(numLocations) +\
+                              " matrices, got: " + str(self.distances.shape) + " and " + str(self.potentialPassengers.shape))
+
+        self.locationToIndex = dict((location, i) for i, location in enumerate(self.locations))
+        if len(self.locationToIndex) != numLocations:
+            raise ValueError("Duplicate locations in network.")
+
+        self._calculateDirections()
+
+        self.connections = []
+        self.connectionMatrix = [[None] * numLocations for i in range(numLocations)]
+        for i in range(numLocations):
+            for j in range(numLocations):
+                if i != j:
+                    connection = Connection(self, i, j)
+                    self.connections.append(connection)
+                    self.connectionMatrix[i][j] = connection
+
+    def _calculateDirections(self):
+        """
+        Precalculate for every connection the direction (cos(alpha), sin(alpha)) from start
+        to end location and the distance between their coordinates, used to move planes over the map.
+        """
+        coords = numpy.array([location.getCoords() for location in self.locations], dtype = float).reshape(-1, 2)
+        x = coords[:, 0][numpy.newaxis, :] - coords[:, 0][:, numpy.newaxis]
+        y = coords[:, 1][numpy.newaxis, :] - coords[:, 1][:, numpy.newaxis]
+        alpha = numpy.arctan2(y, x)
+
+        # Pythagoras, hurray!
+        self.coordsDistances = numpy.sqrt(x**2 + y**2)
+        self.cosAlpha = numpy.cos(alpha)
+        self.sinAlpha = numpy.sin(alpha)
+
+    def getLocations(self):
+        return self.locations
+
+    def getLocation(self, index):
+        return self.locations[index]
+
+    def getLocationIndex(self, location):
+        return self.locationToIndex[location]
+
+    def getConnections(self):
+        return self.connections
+
+    def getConnection(self, startLocation, endLocation):
+        """
+        Get connection from startLocation to endLocation in constant time, None if no connection.
+        """
+        startIndex = self.locationToIndex.get(startLocation, None)
+        endIndex = self.locationToIndex.get(endLocation, None)
+        if startIndex is None or endIndex is None:
+            return None
+        return self.connectionMatrix[startIndex][endIndex]
+
+    def getDistances(self):
+        return self.distances
+
+    def getPotentialPassengers(self):
+        return self.potentialPassengers
+
 class Connection(object):
-    def __init__(self, startLocation, endLocation, distance, potentialPassengers):
-        if startLocation == endLocation:
-            raise ValueError("Connections from and to the same city cannot exist for city: " + str(startLocation) +\
-                              "with id: " + str(startLocation.id()))
-              
-        self.startLocation = startLocation
-        self.endLocation = endLocation
-        self.distance = int(distance)
-        self.potentialPassengers = int(potentialPassengers)
+    """
+    Connection from one location to another, a view on row startIndex and column
+    endIndex of the matrices of a Network.
+    """
+    __slots__ = ("network", "startIndex", "endIndex", "flightPlan")
+
+    def __init__(self, network, startIndex, endIndex):
+        if startIndex == endIndex:
+            location = network.getLocation(startIndex)
+            raise ValueError("Connections from and to the same city cannot exist for city: " + str(location) +\
+                              " with id: " + str(location.getId()))
+
+        self.network = network
+        self.startIndex = startIndex
+        self.endIndex = endIndex
+        self.flightPlan = None # the flightplan this connection is added to, None if not added.
         
     def __str__(self):
-        return str(self.startLocation) + " --" + str(self.distance) + "--> " + str(self.endLocation) 
-        
+        return str(self.getStartLocation()) + " --" + str(self.getDistance()) + "--> " + str(self.getEndLocation())
+
+    def getNetwork(self):
+        return self.network
+
+    def getIndices(self):
+        return self.startIndex, self.endIndex
+
     def getDistance(self):
-        return self.distance
+        return self.network.distances.item(self.startIndex, self.endIndex)
+
+    def getDirection(self):
+        """
+        Get (cos(alpha), sin(alpha)) of the angle alpha from start to end location on the map.
+        """
+        return (self.network.cosAlpha.item(self.startIndex, self.endIndex),
+                self.network.sinAlpha.item(self.startIndex, self.endIndex))
+
+    def getCoordsDistance(self):
+        return self.network.coordsDistances.item(self.startIndex, self.endIndex)
     
     def getStartLocation(self):
-        return self.startLocation
+        return self.network.locations[self.startIndex]
     
     def getEndLocation(self):
-        return self.endLocation
+        return self.network.locations[self.endIndex]
     
     def getLocations(self):
-        return self.startLocation, self.endLocation
+        return self.getStartLocation(), self.getEndLocation()
     
     def getPotentialPassengers(self):
-        return self.potentialPassengers
+        return self.network.potentialPassengers.item(self.startIndex, self.endIndex)
+
+    def setFlightPlan(self, flightPlan):
+        self.flightPlan = flightPlan
+
+    def getFlightPlan(self):
+        return self.flightPlan
 
     def getPotentialPassengersAt(self, time, planes):
         return self.getConnectionLogAt(time, planes).getPotentialPassengers()
 
     def getConnectionLogAt(self, time, planes):
-        potentialPassengers = self.potentialPassengers
+        """
+        Get a ConnectionLog of this connection at time, given all planes flying.
+        If planes are the planes of the flightplan of this connection, the shared
+        DemandIndex of the flightplan is used. Else an index is built for planes.
+        """
+        if self.flightPlan is not None and list(planes) == self.flightPlan.getPlanes():
+            demandIndex = self.flightPlan.getDemandIndex()
+        else:
+            demandIndex = DemandIndex(planes)
 
-        for plane in planes:
+        return demandIndex.getConnectionLogAt(self, time)
+
+class DemandLedger(object):
+    """
+    Number of seats reserved on every connection by all trips of all planes of a flightplan,
+    kept up to date when trips are added, removed or get other passengers. Reserving more
+    seats than potential passengers of a connection raises a ValueError right away, at the
+    cost of a lookup per connection of the trip. While not enforced seats are only counted.
+    """
+
+    def __init__(self):
+        self.connectionToReserved = {}
+        self.enforced = True
+
+    def setEnforced(self, enforced):
+        self.enforced = enforced
+
+    def isEnforced(self):
+        return self.enforced
+
+    def reserve(self, passengers, releasedPassengers = None):
+        """
+        Reserve the seats of passengers {connection:numPassengers}, while releasing those of
+        releasedPassengers (if not None). If enforced, nothing changes if a connection gets
+        over-subscribed.
+        """
+        releasedPassengers = releasedPassengers or {}
+        for connection, numPassengers in passengers.items():
+            reserved = self.getReserved(connection) - releasedPassengers.get(connection, 0)
+            potentialPassengers = connection.getPotentialPassengers()
+
+            if self.enforced and reserved + numPassengers > potentialPassengers:
+                raise ValueError("Illegal passenger subtraction in connection: " + str(connection) +\
+                                  ", tried to subtract " + str(numPassengers) +\
+                                   " from " + str(potentialPassengers - reserved))
+
+        self.release(releasedPassengers)
+        for connection, numPassengers in passengers.items():
+            self.connectionToReserved[connection] = self.getReserved(connection) + numPassengers
+
+    def reserveTrips(self, trips):
+        """
+        Reserve the seats of all trips, either all or none of them.
+        """
+        reservedTrips = []
+        try:
+            for trip in trips:
+                self.reserve(trip.getPassengers())
+                reservedTrips.append(trip)
+        except ValueError:
+            for trip in reservedTrips:
+                self.release(trip.getPassengers())
+            raise
 
+    def release(self, passengers):
+        for connection, numPassengers in passengers.items():
+            self.connectionToReserved[connection] = self.getReserved(connection) - numPassengers
+
+    def getReserved(self, connection):
+        return self.connectionToReserved.get(connection, 0)
+
+    def getRemaining(self, connection):
+        """
+        Get the number of potential passengers of connection that are not reserved by any trip.
+        """
+        return connection.getPotentialPassengers() - self.getReserved(connection)
+
+class DemandIndex(object):
+    """
+    Passengers taken from each connection over time by the trips of a set of planes.
+    For every connection a sorted list of the start times of the trips carrying its
+    passengers is stored, together with the cumulative number of passengers taken
+    by trips starting up to and including that time. The passengers still willing
+    to travel over a connection at any time can then be found by a single bisect.
+    """
+
+    def __init__(self, planes, version = None):
+        self.version = version
+        self.flightPlan = None # flightplan of the planes, for SimulationStats.
+        self.connectionToStartTimes = {}
+        self.connectionToPassengersTaken = {}
+        self.bookingArrays = None # all bookings sorted on time as NumPy arrays, built lazily in _getBookingArrays.
+
+        connectionToBookings = {}
+        for plane in planes:
+            self.flightPlan = plane.getFlightPlan()
             for trip in plane.getTrips():
-                passengers = trip.getPassengers()
+                for connection, numPassengers in trip.getPassengers().items():
+                    connectionToBookings.setdefault(connection, []).append((trip.getStartTime(), numPassengers))
 
-                if trip.getStartTime() <= time:
-                    potentialPassengers -= passengers.get(self, 0)
-                else:
-                    break
+        for connection, bookings in connectionToBookings.items():
+            bookings.sort(key = lambda booking : booking[0])
+
+            passengersTaken = 0
+            cumulativePassengersTaken = []
+            for startTime, numPassengers in bookings:
+                passengersTaken += numPassengers
+                cumulativePassengersTaken.append(passengersTaken)
+
+            self.connectionToStartTimes[connection] = [startTime for startTime, numPassengers in bookings]
+            self.connectionToPassengersTaken[connection] = cumulativePassengersTaken
+
+    def getVersion(self):
+        return self.version
+
+    def getConnections(self):
+        """
+        Get all connections from which passengers are taken.
+        """
+        return self.connectionToStartTimes.keys()
+
+    def getTotalPassengersTaken(self, connection):
+        passengersTaken = self.connectionToPassengersTaken.get(connection, None)
+        if passengersTaken is None:
+            return 0
+        return passengersTaken[-1]
+
+    def getPassengersTakenAt(self, connection, time):
+        """
+        Get the number of passengers taken from connection by all trips started at time.
+        """
+        startTimes = self.connectionToStartTimes.get(connection, None)
+        if startTimes is None:
+            return 0
+
+        index = bisect.bisect_right(startTimes, time)
+        if index == 0:
+            return 0
+        return self.connectionToPassengersTaken[connection][index - 1]
+
+    def getConnectionLogAt(self, connection, time):
+        potentialPassengers = connection.getPotentialPassengers() - self.getPassengersTakenAt(connection, time)
+        return ConnectionLog(connection, time, potentialPassengers)
+
+    def _getBookingArrays(self):
+        """
+        Get all bookings (passengers taken from a connection by a trip) sorted on start time,
+        as arrays: start times, start location indices, end location indices and passengers.
+        """
+        if self.bookingArrays is None:
+            bookings = []
+            for connection, startTimes in self.connectionToStartTimes.items():
+                startIndex, endIndex = connection.getIndices()
+                previousTaken = 0
+                for startTime, passengersTaken in zip(startTimes, self.connectionToPassengersTaken[connection]):
+                    bookings.append((startTime, startIndex, endIndex, passengersTaken - previousTaken))
+                    previousTaken = passengersTaken
+
+            bookings.sort()
+            bookings = numpy.array(bookings, dtype = float).reshape((len(bookings), 4))
+            self.bookingArrays = (bookings[:, 0], bookings[:, 1].astype(int), bookings[:, 2].astype(int),
+                                  bookings[:, 3].astype(int))
+
+        return self.bookingArrays
+
+    def getDemandMatricesAt(self, network, times):
+        """
+        Get the remaining demand between all locations of network at all times (sorted or not):
+        the potential passengers of passengers.txt minus the passengers taken by trips started
+        at or before each time. All matrices come from one cumulative pass over the bookings.
+        :returns: int array(times x locations x locations), ordered as network.getLocations().
+        """
+        startTimes, startIndices, endIndices, passengers = self._getBookingArrays()
+        numLocations = len(network.getLocations())
+        times = numpy.asarray(times, dtype = float)
+
+        # number of bookings at or before every time, and the booked passengers in between.
+        order = numpy.argsort(times, kind = "mergesort")
+        counts = numpy.searchsorted(startTimes, times[order], side = "right")
+        cells = startIndices * numLocations + endIndices
+
+        demandMatrices = numpy.empty((len(times), numLocations, numLocations), dtype = int)
+        passengersTaken = numpy.zeros(numLocations * numLocations, dtype = int)
+        lastCount = 0
+        for i, count in zip(order, counts):
+            if count > lastCount:
+                passengersTaken += numpy.bincount(cells[lastCount:count], passengers[lastCount:count],
+                                                  minlength = numLocations * numLocations).astype(int)
+                lastCount = count
+            demandMatrices[i] = network.getPotentialPassengers() - passengersTaken.reshape((numLocations, numLocations))
+
+        return demandMatrices
+
+    def getPotentialPassengersAt(self, connections, times):
+        """
+        Get the potential passengers of connections at all times (sorted or not).
+        :returns: array(connections x times) of potential passengers.
+        """
+        times = numpy.asarray(times, dtype = float)
+        potentialPassengers = numpy.zeros((len(connections), len(times)), dtype = int)
 
-        return ConnectionLog(self, time, potentialPassengers)
+        for i, connection in enumerate(connections):
+            potentialPassengers[i, :] = connection.getPotentialPassengers()
+
+            startTimes = self.connectionToStartTimes.get(connection, None)
+            if startTimes is not None:
+                passengersTaken = numpy.concatenate(([0], self.connectionToPassengersTaken[connection]))
+                potentialPassengers[i, :] -= passengersTaken[numpy.searchsorted(startTimes, times, side = "right")]
+
+        return potentialPassengers
 
 class ConnectionLog(object):
     def __init__(self, connection, time, potentialPassengers):
@@ -984,6 +2839,141 @@ class Location(object):
     def printConnections(self):
         print ', '.join([str(connection) for connection in self.connections])
 
+class SimulationStats(object):
+    """
+    Number of calls and total wall time (in seconds, including nested calls) per
+    instrumented method, see instrumentedMethods, of the simulation of flightPlan only.
+    While any stats are enabled the instrumented methods are replaced by timed wrappers,
+    which count a call for the stats of the flightplan the object belongs to (if enabled).
+    When the last stats are disabled the original methods are restored, and instrumentation
+    costs nothing.
+    """
+
+    nameToMethod = {} # original instrumented methods, while any stats are enabled.
+    numEnabled = 0 # number of enabled stats.
+
+    def __init__(self, flightPlan):
+        self.flightPlan = flightPlan
+        self.nameToCalls = {}
+        self.nameToTime = {}
+        self.nameToCode = {}
+
+    def enable(self):
+        if self.isEnabled():
+            return
+
+        if SimulationStats.numEnabled == 0:
+            for cls, methodName, getFlightPlan in instrumentedMethods:
+                method = cls.__dict__[methodName]
+                name = cls.__name__ + "." + methodName
+                SimulationStats.nameToMethod[name] = method
+                setattr(cls, methodName, SimulationStats._timed(name, method, getFlightPlan))
+
+        for name, method in SimulationStats.nameToMethod.items():
+            self.nameToCode[name] = method.func_code
+
+        self.flightPlan.stats = self
+        SimulationStats.numEnabled += 1
+
+    def disable(self):
+        if not self.isEnabled():
+            return
+
+        self.flightPlan.stats = None
+        SimulationStats.numEnabled -= 1
+
+        if SimulationStats.numEnabled == 0:
+            for cls, methodName, getFlightPlan in instrumentedMethods:
+                setattr(cls, methodName, SimulationStats.nameToMethod.pop(cls.__name__ + "." + methodName))
+
+    def isEnabled(self):
+        return self.flightPlan.stats is self
+
+    @staticmethod
+    def _timed(name, method, getFlightPlan):
+        def timedMethod(self, *args, **kwargs):
+            flightPlan = getFlightPlan(self)
+            stats = None if flightPlan is None else flightPlan.stats
+            if stats is None:
+                return method(self, *args, **kwargs)
+
+            start = timeit.default_timer()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats.nameToCalls[name] = stats.nameToCalls.get(name, 0) + 1
+                stats.nameToTime[name] = stats.nameToTime.get(name, 0) + timeit.default_timer() - start
+
+        timedMethod.__name__ = method.__name__
+        timedMethod.__doc__ = method.__doc__
+        return timedMethod
+
+    def reset(self):
+        self.nameToCalls.clear()
+        self.nameToTime.clear()
+
+    def getNames(self):
+        return sorted(self.nameToCalls)
+
+    def getCalls(self, name):
+        return self.nameToCalls.get(name, 0)
+
+    def getTime(self, name):
+        return self.nameToTime.get(name, 0)
+
+    def asDict(self):
+        """
+        Get the stats as {name : {"calls" : int, "time" : float}}.
+        """
+        return dict((name, {"calls" : self.getCalls(name), "time" : self.getTime(name)}) for name in self.getNames())
+
+    def dumpJson(self, fileName):
+        statsFile = open(fileName, 'w')
+        json.dump(self.asDict(), statsFile, indent = 2, sort_keys = True)
+        statsFile.close()
+
+    def dumpPstats(self, fileName):
+        """
+        Write the stats in the format of profile/cProfile, to be read with pstats.Stats(fileName).
+        Only total times are known, so internal time equals cumulative time.
+        """
+        stats = {}
+        for name in self.getNames():
+            code = self.nameToCode[name]
+            key = (code.co_filename, code.co_firstlineno, name)
+            calls = self.getCalls(name)
+            time = self.getTime(name)
+            stats[key] = (calls, calls, time, time, {})
+
+        statsFile = open(fileName, 'wb')
+        marshal.dump(stats, statsFile)
+        statsFile.close()
+
+    def __str__(self):
+        lines = ["%-40s %10s %12s" %("method", "calls", "time (s)")]
+        for name in self.getNames():
+            lines.append("%-40s %10d %12.6f" %(name, self.getCalls(name), self.getTime(name)))
+        return "\n".join(lines)
+
+# (class, method name, function getting the flightplan of an object) of all methods counted
+# and timed by SimulationStats.
+instrumentedMethods = [
+    (Simulation, "getSimulationLogAt", Simulation.getFlightPlan),
+    (Simulation, "_testPlanes", Simulation.getFlightPlan),
+    (Simulation, "_testPassengers", Simulation.getFlightPlan),
+    (Simulation, "_testFuel", Simulation.getFlightPlan),
+    (Simulation, "_testTrips", Simulation.getFlightPlan),
+    (Simulation, "_interpretConfig", Simulation.getFlightPlan),
+    (Simulation, "_interpretLocations", Simulation.getFlightPlan),
+    (Simulation, "_interpretConnections", Simulation.getFlightPlan),
+    (Simulation, "_interpretPlanes", Simulation.getFlightPlan),
+    (Simulation, "_interpretTrips", Simulation.getFlightPlan),
+    (FlightPlan, "getConnectionToLogAt", lambda flightPlan : flightPlan),
+    (Plane, "getPlaneLogAt", Plane.getFlightPlan),
+    (Connection, "getConnectionLogAt", Connection.getFlightPlan),
+    (DemandIndex, "getConnectionLogAt", lambda demandIndex : demandIndex.flightPlan)
+]
+
 if __name__ == "__main__":
     s = Simulation();
     s.run()
\ No newline at end of file
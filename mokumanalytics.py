@@ -0,0 +1,156 @@
+from __future__ import division
+
+import numpy
+
+groupings = [None, "plane", "planetype", "location", "connection"] # groupBy options of computeAggregates.
+
+# all aggregates of computeAggregates:
+# - trips, number of trips taking off in the window
+# - passengers, number of passengers boarding those trips
+# - passengerkilometers, made by passengers leaving a plane in the window
+# - fuelburned, km of fuel used in flight in the window
+# - blockhours, hours in flight in the window
+# - groundhours, hours of ground time after a flight in the window
+# - loadfactor, passenger km flown / seat km flown in the window
+# - utilization, block hours / (hours in the window * number of planes), only for None, plane and planetype
+aggregateNames = ["trips", "passengers", "passengerkilometers", "fuelburned", "blockhours", "groundhours",
+                  "loadfactor", "utilization"]
+
+class AggregateTable(object):
+    """
+    Aggregates per group, as columns (NumPy arrays) with one entry per key (see getKeys).
+    """
+
+    def __init__(self, groupBy, keys, nameToColumn):
+        self.groupBy = groupBy
+        self.keys = keys
+        self.nameToColumn = nameToColumn
+
+    def getGroupBy(self):
+        return self.groupBy
+
+    def getKeys(self):
+        return self.keys
+
+    def getColumnNames(self):
+        return [name for name in aggregateNames if name in self.nameToColumn]
+
+    def getColumn(self, name):
+        if name not in self.nameToColumn:
+            raise ValueError("Unknown aggregate: " + str(name) + ", choose from: " + str(self.getColumnNames()))
+        return self.nameToColumn[name]
+
+    def getRow(self, key):
+        """
+        Get all aggregates of key as a dictionary {name : value}.
+        """
+        index = self.keys.index(key)
+        return dict((name, self.nameToColumn[name][index]) for name in self.getColumnNames())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __str__(self):
+        names = self.getColumnNames()
+        lines = ["%-30s" %(self.groupBy or "") + "".join("%20s" %(name) for name in names)]
+        for i, key in enumerate(self.keys):
+            lines.append("%-30s" %(key) + "".join("%20.2f" %(self.nameToColumn[name][i]) for name in names))
+        return "\n".join(lines)
+
+def _getOverlap(starts, ends, windowStart, windowEnd):
+    """ Get the time each interval [start, end) overlaps with [windowStart, windowEnd). """
+    return numpy.maximum(numpy.minimum(ends, windowEnd) - numpy.maximum(starts, windowStart), 0)
+
+def _getGroups(simulation, tripTable, groupBy):
+    """
+    Get the keys of all groups, the group of every trip (index in keys) and the number of
+    planes of every group (None if groups are not made of planes).
+    """
+    planes = tripTable.getPlanes()
+    planeIndices = tripTable.getColumn("plane")
+
+    if groupBy is None:
+        return ["all"], numpy.zeros(tripTable.getNumTrips(), dtype = int), numpy.array([len(planes)])
+
+    if groupBy == "plane":
+        return list(planes), planeIndices, numpy.ones(len(planes), dtype = int)
+
+    if groupBy == "planetype":
+        planeTypes = sorted(set(plane.getPlaneType() for plane in planes))
+        typeIndices = numpy.array([planeTypes.index(plane.getPlaneType()) for plane in planes], dtype = int)
+        numPlanes = numpy.bincount(typeIndices, minlength = len(planeTypes))
+        return planeTypes, typeIndices[planeIndices] if len(planeIndices) > 0 else planeIndices, numPlanes
+
+    network = simulation.getFlightPlan().getNetwork()
+    locations = network.getLocations()
+    if groupBy == "location":
+        return list(locations), tripTable.getColumn("startlocation"), None
+
+    # connection, only connections flown are a group.
+    codes = tripTable.getColumn("startlocation") * len(locations) + tripTable.getColumn("endlocation")
+    uniqueCodes, groups = numpy.unique(codes, return_inverse = True)
+    keys = [network.getConnection(locations[code // len(locations)], locations[code % len(locations)])\
+            for code in uniqueCodes]
+    return keys, groups, None
+
+def computeAggregates(simulation, groupBy = None, startTime = None, endTime = None):
+    """
+    Compute all aggregateNames per group of trips, from the TripTable of the simulation at once.
+    Trips that only partly fall in the time window count for the part inside it.
+    :param groupBy: one of groupings: None (all trips), plane, planetype, location (of departure)
+    or connection.
+    :param startTime: start of the window, start of the simulation if None.
+    :param endTime: end of the window (exclusive, unless it is the end of the simulation), end of
+    the simulation if None.
+    :rtype: AggregateTable
+    """
+    if groupBy not in groupings:
+        raise ValueError("Unknown grouping: " + str(groupBy) + ", choose from: " + str(groupings))
+
+    startTime = simulation.getStartTime() if startTime is None else startTime
+    endTime = simulation.getEndTime() if endTime is None else endTime
+    if endTime <= startTime:
+        raise ValueError("Window end: " + str(endTime) + " is not after window start: " + str(startTime))
+
+    tripTable = simulation.getFlightPlan().getTripTable()
+    keys, groups, numPlanes = _getGroups(simulation, tripTable, groupBy)
+    column = tripTable.getColumn
+
+    flightTimes = column("landtime") - column("starttime")
+    flightOverlap = _getOverlap(column("starttime"), column("landtime"), startTime, endTime)
+    groundOverlap = _getOverlap(column("landtime"), column("endtime"), startTime, endTime)
+    flownFraction = numpy.where(flightTimes > 0, flightOverlap / numpy.maximum(flightTimes, 1e-12), 0)
+    distanceFlown = column("distance") * flownFraction
+    takesOff = (startTime <= column("starttime")) & (column("starttime") < endTime)
+    # passengers are dropped off when the ground time ends, at the end of the simulation included.
+    endsInWindow = column("endtime") < endTime
+    if endTime == simulation.getEndTime():
+        endsInWindow = column("endtime") <= endTime
+    dropsOff = (startTime <= column("endtime")) & endsInWindow
+
+    def groupSum(values):
+        return numpy.bincount(groups, weights = values, minlength = len(keys)).astype(float)
+
+    nameToColumn = {
+        "trips" : groupSum(takesOff),
+        "passengers" : groupSum(column("passengers") * takesOff),
+        "passengerkilometers" : groupSum(column("passengerkilometers") * dropsOff),
+        "fuelburned" : groupSum(distanceFlown),
+        "blockhours" : groupSum(flightOverlap) / 60,
+        "groundhours" : groupSum(groundOverlap) / 60
+    }
+
+    seatKilometers = groupSum(column("maxpassengers") * distanceFlown)
+    nameToColumn["loadfactor"] = groupSum(column("onboard") * distanceFlown) / numpy.maximum(seatKilometers, 1e-12)
+    if numPlanes is not None:
+        nameToColumn["utilization"] = nameToColumn["blockhours"] / ((endTime - startTime) / 60 * numPlanes)
+
+    return AggregateTable(groupBy, keys, nameToColumn)
+
+def getTripLoadFactors(simulation):
+    """
+    Get the load factor (passengers on board / max passengers) of every trip, in the order
+    of the TripTable of the simulation.
+    """
+    tripTable = simulation.getFlightPlan().getTripTable()
+    return tripTable.getColumn("onboard") / tripTable.getColumn("maxpassengers").astype(float)
@@ -0,0 +1,23 @@
+from __future__ import division
+
+import colorsys
+
+# shared by the GUI (mokumgui) and the renderer (mokumrenderer), without importing Tkinter.
+colors = ["#ff0000", "#00ff00", "#0000ff", "#008000", "#ff00ff", "#00ffff"] # colors of the first planes.
+deviationX = 10 # deviation from x coordinate to image
+deviationY = -30 # deviation from y coordinate to image
+
+def generateColors(numColors):
+    """
+    Get numColors distinct colors, starting with colors. Further hues are spread with the
+    golden ratio, so any number of planes can be told apart.
+    """
+    planeColors = colors[:numColors]
+    goldenRatio = (5 ** .5 - 1) / 2
+    hue = 0
+    while len(planeColors) < numColors:
+        hue = (hue + goldenRatio) % 1
+        saturation = .9 if len(planeColors) % 2 == 0 else .6
+        red, green, blue = colorsys.hsv_to_rgb(hue, saturation, .95)
+        planeColors.append("#%02x%02x%02x" %(int(red * 255), int(green * 255), int(blue * 255)))
+    return planeColors
@@ -91,7 +91,9 @@ if __name__ == "__main__":
 	plane.addTrip(trip)
 
 	# Lets quickly check if the simulation still matches the constraints.
-	simulation.preSimulation()
+	# As only one plane changed, we can let the pre simulation check just
+	# the planes (and connections) that changed since the last successful check.
+	simulation.preSimulation(incremental = True)
 
 	# Yup all good. Okay, so we removed an existing trip and put it back.
 	# Now lets add a new trip.
@@ -191,7 +193,7 @@ if __name__ == "__main__":
 	plane.addTrip(trip)
 
 	try:
-		simulation.preSimulation()
+		simulation.preSimulation(incremental = True)
 	except ValueError, e:
 		print "Oh no, constraints aren't being matched: " + str(e)
 
@@ -221,6 +223,10 @@ if __name__ == "__main__":
 	# saved in passengerkilometers.png
 	#plotter.plotPassengerKilometers(simulation)
 
+	# creates all plots (also load factor, passengers on board and remaining
+	# demand) from a single pass over the simulation.
+	#plotter.plotAll(simulation)
+
 	# Okay, that's some plotting done. Now lets use the 
 	# Graphical User Interface (GUI).
 	# Note: I commented this code, as you would get a frame on your screen
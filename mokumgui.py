@@ -1,13 +1,15 @@
 from __future__ import division
 
 import Tkinter as tk
+import Queue
 import datetime as dt
+import threading
+import timeit
 from mokum import Simulation
+from mokumdrawing import colors, deviationX, deviationY, generateColors
 
-colors = ["#ff0000", "#00ff00", "#0000ff", "#008000", "#ff00ff", "#00ffff"]
-maxPlanes = len(colors)
-deviationX = 10 # deviation from x coordinate to image
-deviationY = -30 # deviation from y coordinate to image
+frameInterval = 10 # time in ms between the start of two frames.
+prefetchSize = 32 # max number of frames computed ahead of playback, see FramePrefetcher.
 numTableRows = 10
 
 class SimulationGUI(tk.Frame):              
@@ -22,20 +24,20 @@ class SimulationGUI(tk.Frame):
         self.time = self.startTime
         self.endTime = self.simulation.getEndTime()
         self.planes = self.simulation.getPlanes()
-        self.simulationLog = self.simulation.getSimulationLogAt(self.time)
+        self.cursor = self.simulation.getCursor(self.time) # for frames drawn while paused, see drawSimulation.
+        self.simulationLog = self.cursor.getSimulationLog()
+        self.framePrefetcher = FramePrefetcher(self.simulation) # computes frames during playback.
 
-        if len(self.planes) > maxPlanes:
-            raise ValueError("Graphical simulation supports up to " + str(maxPlanes) + " planes. " +\
-                              str(len(self.planes)) + " planes given.")
-            
         if len(self.planes) == 0:
             raise ValueError("No planes to simulate.")
         
         self.planeToColor = {}
+        planeColors = generateColors(len(self.planes))
         for i in range(len(self.planes)):
-            self.planeToColor[self.planes[i]] = colors[i]
+            self.planeToColor[self.planes[i]] = planeColors[i]
             
-        self.planeFigures = []
+        self.planeToFigures = {} # plane : (lineId, rectangleId), created once in createWidgets.
+        self.planeToFigureState = {} # plane : (isOnTrip, coords) as last drawn.
         
         self.locations = self.simulation.getLocations()
         
@@ -44,24 +46,37 @@ class SimulationGUI(tk.Frame):
         self.createWidgets()
 
     def start(self):
+        self.framePrefetcher.start()
         self.mainloop()
+        self.framePrefetcher.stop()
 
     def run(self):
+        frameStart = timeit.default_timer()
+
         if self.isPaused:
             time = self.timeEntry.getTime()
             if time != self.time:
-                self.time = time
-                self.drawSimulation()
+                self.setTime(time)
         
         elif self.time < self.endTime:
-            self.time = self.timeEntry.nextTime()
-            self.drawSimulation()
+            # restart prefetching if it does not follow time and time step, after a speed change for instance.
+            timeStep = self.timeEntry.getTimeStep()
+            if not self.framePrefetcher.isPrefetching(self.time, timeStep):
+                self.framePrefetcher.restart(self.time, timeStep)
+
+            # only draw frames that are ready, playback waits for the prefetcher if needed.
+            simulationLog = self.framePrefetcher.getFrame()
+            if simulationLog is not None:
+                self.time = self.timeEntry.showTime(simulationLog.getTime())
+                self.drawSimulation(simulationLog)
 
-        self.after(10, self.run)
+        # keep a steady frame rate, however long drawing took.
+        drawTime = int((timeit.default_timer() - frameStart) * 1000)
+        self.after(max(1, frameInterval - drawTime), self.run)
 
     def restartSimulation(self):
+        self.timeEntry.showTime(self.timeEntry.restartTime())
         self.pause(False)
-        self.time = self.timeEntry.restartTime()
 
     def togglePause(self):
         self.pause(not self.isPaused)
@@ -74,8 +89,20 @@ class SimulationGUI(tk.Frame):
         else:
             self.pauseButton.config(text = "Pause")
         
-        self.timeEntry.pause(self.isPaused)
-        
+        # on resume the time entry takes the time typed in while paused.
+        self.setTime(self.timeEntry.pause(self.isPaused))
+
+    def setTime(self, time):
+        """
+        Go to time, the time of the time entry. Prefetched frames are dropped, and while
+        playing prefetching starts over from time.
+        """
+        self.time = time
+        if self.isPaused:
+            self.framePrefetcher.flush()
+        else:
+            self.framePrefetcher.restart(self.time, self.timeEntry.getTimeStep())
+
         self.drawSimulation()
     
     def createWidgets(self):
@@ -91,6 +118,13 @@ class SimulationGUI(tk.Frame):
         self.canvas = tk.Canvas(self, width = 450, height = 450)
         self.canvas.grid(row = 1, column = 0, columnspan = 5, rowspan = 1)
         self.canvas.create_image(10, 10, image = self.image, anchor = 'nw')
+
+        # every plane has a line (on a trip) and a rectangle (waiting), only one of them is shown.
+        for plane in self.planes:
+            color = self.planeToColor[plane]
+            lineId = self.canvas.create_line(0, 0, 0, 0, fill = color, arrow = "last", width = 3.0, state = tk.HIDDEN)
+            rectangleId = self.canvas.create_rectangle(0, 0, 0, 0, fill = color, state = tk.HIDDEN)
+            self.planeToFigures[plane] = (lineId, rectangleId)
         
         self.timeEntry = TimeEntry(self.isPaused, startTime = self.startTime, endTime = self.endTime,
                                     master = self)
@@ -102,38 +136,49 @@ class SimulationGUI(tk.Frame):
         self.locationTable = LocationTable(self.locations, self.simulationLog, master = self)
         self.locationTable.grid(row = 1, column = 6)
 
-    def drawSimulation(self):
-        self.simulationLog = self.simulation.getSimulationLogAt(self.time)
+    def drawSimulation(self, simulationLog = None):
+        """
+        Draw simulationLog, or the frame at the current time if None.
+        """
+        if simulationLog is None:
+            self.cursor.seek(self.time)
+            simulationLog = self.cursor.getSimulationLog()
+
+        self.simulationLog = simulationLog
         planeToLog = self.simulationLog.getPlaneToLog()
-        
-        for figure in self.planeFigures:
-            self.canvas.delete(figure)
        
+        # figures are only moved (and shown or hidden) if the plane changed since the last frame.
         for plane, log in planeToLog.iteritems():
+            lineId, rectangleId = self.planeToFigures[plane]
             trip = log.getTrip()
+            x, y = log.getCoords()
+            x += deviationX
+            y += deviationY
+
             if trip != None:
                 x1, y1 = trip.getConnection().getStartLocation().getCoords()
-                x2, y2 = log.getCoords()
-                x1 += deviationX
-                x2 += deviationX
-                y1 += deviationY
-                y2 += deviationY
-                lineId = self.canvas.create_line(x1, y1, x2, y2, fill = self.planeToColor[plane],
-                                                  arrow = "last", width = 3.0)
-                self.planeFigures.append(lineId)
+                figureState = (True, (x1 + deviationX, y1 + deviationY, x, y))
             else:
-                x, y = log.getCoords()
-                x += deviationX
-                y += deviationY
-                rectangleId = self.canvas.create_rectangle(x - 3, y - 3, x + 3, y + 3,
-                                                            fill = self.planeToColor[plane])
-                self.planeFigures.append(rectangleId)
-            
-        self.canvas.update()
+                figureState = (False, (x - 3, y - 3, x + 3, y + 3))
+
+            lastFigureState = self.planeToFigureState.get(plane, None)
+            if figureState == lastFigureState:
+                continue
+
+            isOnTrip, coords = figureState
+            if lastFigureState is None or lastFigureState[0] != isOnTrip:
+                self.canvas.itemconfig(lineId, state = tk.NORMAL if isOnTrip else tk.HIDDEN)
+                self.canvas.itemconfig(rectangleId, state = tk.HIDDEN if isOnTrip else tk.NORMAL)
+
+            self.canvas.coords(lineId if isOnTrip else rectangleId, *coords)
+            self.planeToFigureState[plane] = figureState
 
         self.planeTable.updatePlaneTable(self.simulationLog)
         self.locationTable.updateLocationTable(self.simulationLog)
 
+        # redraw all changes of this frame at once.
+        self.update_idletasks()
+
 class TimeEntry(tk.Frame):
     def __init__(self, isPaused, startTime = 0, endTime = 1440, master = None):
         tk.Frame.__init__(self, master, colormap = "new")
@@ -189,12 +234,6 @@ class TimeEntry(tk.Frame):
         self.time = self.startTime
         return self.time
     
-    def nextTime(self):
-        if self.startTime <= self.time + self.timeStep < self.endTime:
-            self.time += self.timeStep
-            self._updateTimeEntry()
-        return self.time
-    
     def speedUp(self):
         self.timeStep += .1
         
@@ -229,11 +268,20 @@ class TimeEntry(tk.Frame):
 
             self.timeStepEntry.delete(0, tk.END)
             self.timeStepEntry.insert(0, str(self.timeStep))
-            
-        self.timeEntry.update()
     
     def getTime(self):
         return self.time
+
+    def getTimeStep(self):
+        return self.timeStep
+
+    def showTime(self, time):
+        """
+        Set the time to the time of a frame computed ahead (see FramePrefetcher).
+        """
+        self.time = time
+        self._updateTimeEntry()
+        return self.time
     
     def onSetTimeStep(self, event):
         self.setTimeStep()
@@ -378,8 +426,6 @@ class PlaneTable(tk.Frame):
             
             for j in range(2):
                 currentRow[j].config(text = "")
-                
-        self.update()
 
 # TODO, LocationTable makes the 'stupid' assumption every location has the same amount of connections, fix?  
 class LocationTable(tk.Frame):
@@ -414,7 +460,6 @@ class LocationTable(tk.Frame):
                                           command = self.nextLocation, width = 18)
         self.nextLocationButton.grid(row = 0, column = 1, sticky = "nsew", padx = 1, pady = 1)
         
-        connectionToLog = self.simulationLog.getConnectionToLog()
         for i, connection in enumerate(self.currentLocation.getConnections()):
             currentRow = []
             
@@ -422,7 +467,7 @@ class LocationTable(tk.Frame):
             label.grid(row = i + 2, column = 0, sticky = "nsew", padx = 1, pady = 1)
             currentRow.append(label)
             
-            label = tk.Label(self, text = str(connectionToLog[connection].getPotentialPassengers()),
+            label = tk.Label(self, text = str(self.simulationLog.getConnectionLog(connection).getPotentialPassengers()),
                               borderwidth = 0, width = 6)
             label.grid(row = i + 2, column = 1, sticky = "nsew", padx = 1, pady = 1)
             currentRow.append(label)
@@ -434,13 +479,11 @@ class LocationTable(tk.Frame):
         self.simulationLog = simulationLog
         self.titleLabel.config(text = str(self.currentLocation))
         
-        connectionToLog = simulationLog.getConnectionToLog()
-
         for i, connection in enumerate(self.currentLocation.getConnections()):
             currentRow = self.tableEntries[i]
             
             currentRow[0].config(text = str(connection))
-            currentRow[1].config(text = str(connectionToLog[connection].getPotentialPassengers()))
+            currentRow[1].config(text = str(simulationLog.getConnectionLog(connection).getPotentialPassengers()))
      
     def nextLocation(self):
         self._setLocation((self.currentLocationNum + 1) % len(self.locations))
@@ -454,6 +497,119 @@ class LocationTable(tk.Frame):
         self.currentLocation = self.locations[self.currentLocationNum]
         self.updateLocationTable(self.simulationLog)
 
+class FramePrefetcher(object):
+    """
+    Background thread computing the frames (complete SimulationLogs) after the playback time
+    into a bounded queue, so the Tk thread only has to draw them. Frames follow the playback
+    times: time + timeStep, time + 2 * timeStep, ... as long as they lie within the simulation.
+    Frames of before a flush or restart are never returned.
+    """
+
+    def __init__(self, simulation):
+        self.simulation = simulation
+        self.startTime = simulation.getStartTime()
+        self.endTime = simulation.getEndTime()
+        self.queue = Queue.Queue(prefetchSize)
+        self.lock = threading.Lock()
+        self.wakeUp = threading.Event()
+        self.generation = 0 # incremented on every flush and restart, outdates all queued frames.
+        self.nextTime = None # time of the next frame to compute.
+        self.timeStep = None # None if not prefetching.
+        self.lastTime = None # time of the last frame returned (or the time prefetching started at).
+        self.isStopped = False
+        self.thread = threading.Thread(target = self._prefetch)
+        self.thread.daemon = True
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.isStopped = True
+        self.wakeUp.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def flush(self):
+        """
+        Stop prefetching and drop all frames computed so far.
+        """
+        with self.lock:
+            self.generation += 1
+            self.timeStep = None
+            self._clearQueue()
+
+    def restart(self, time, timeStep):
+        """
+        Drop all frames computed so far, and prefetch the frames after time with steps of timeStep.
+        """
+        with self.lock:
+            self.generation += 1
+            self.nextTime = time + timeStep
+            self.timeStep = timeStep
+            self.lastTime = time
+            self._clearQueue()
+        self.wakeUp.set()
+
+    def isPrefetching(self, time, timeStep):
+        """
+        Check whether the frames after time with steps of timeStep are being prefetched.
+        """
+        return self.timeStep == timeStep and self.lastTime == time
+
+    def getFrame(self):
+        """
+        Get the next prefetched SimulationLog, None if it is not ready yet.
+        """
+        while True:
+            try:
+                generation, simulationLog = self.queue.get_nowait()
+            except Queue.Empty:
+                return None
+
+            if generation == self.generation:
+                self.lastTime = simulationLog.getTime()
+                return simulationLog
+
+    def _clearQueue(self):
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Queue.Empty:
+                return
+
+    def _prefetch(self):
+        cursor = None
+
+        while not self.isStopped:
+            with self.lock:
+                generation, time, timeStep = self.generation, self.nextTime, self.timeStep
+
+            if timeStep is None or not self.startTime <= time < self.endTime:
+                self.wakeUp.wait(.1)
+                self.wakeUp.clear()
+                continue
+
+            if cursor is None:
+                cursor = self.simulation.getCursor(time)
+            else:
+                cursor.seek(time)
+
+            simulationLog = cursor.getSimulationLog()
+            simulationLog.getConnectionToLog() # create all connection logs here, not on the Tk thread.
+
+            with self.lock:
+                if generation != self.generation:
+                    continue
+                self.nextTime = time + timeStep
+
+            # wait for room in the queue, unless the frame got outdated in the meantime.
+            while not self.isStopped and generation == self.generation:
+                try:
+                    self.queue.put((generation, simulationLog), timeout = .1)
+                    break
+                except Queue.Full:
+                    pass
+
 def run(simulation):
     master = tk.Tk()
 
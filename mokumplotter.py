@@ -1,66 +1,220 @@
-from mokum import Simulation
-import pylab
+from __future__ import division
+import multiprocessing
+import os
 
-def plotFuel(simulation, fileName = 'fuel'):
+import numpy
+
+# all metrics collectMetrics can gather, per plane unless noted otherwise:
+# fuel (km), passengerkilometers, loadfactor (passengers / max passengers),
+# passengers (on board) and remainingdemand (potential passengers per connection).
+metricNames = ["fuel", "passengerkilometers", "loadfactor", "passengers", "remainingdemand"]
+
+# (simulation, times) of the collecting process, inherited by the worker processes of collectMetrics.
+_collectContext = None
+
+class SimulationMetrics(object):
 	"""
-	produces a plot of the fuel in the planes over the simulation with timesteps
-	of 1 minute.
+	Series of metrics of a simulation at the same times, gathered in one pass by collectMetrics.
+	Plane metrics are arrays with a row per plane, remainingdemand has a row per connection.
 	"""
 
-	print "Plotting fuel, this might take a while depending on the size of the simulation."
+	def __init__(self, times, planes, connections, nameToSeries):
+		self.times = times
+		self.planes = planes
+		self.connections = connections
+		self.nameToSeries = nameToSeries
+
+	def getTimes(self):
+		return self.times
+
+	def getPlanes(self):
+		return self.planes
 
+	def getConnections(self):
+		return self.connections
+
+	def getNames(self):
+		return self.nameToSeries.keys()
+
+	def hasSeries(self, name):
+		return name in self.nameToSeries
+
+	def getSeries(self, name):
+		if name not in self.nameToSeries:
+			raise ValueError("Metric " + str(name) + " was not collected, collected: " + str(self.getNames()))
+		return self.nameToSeries[name]
+
+def _collectPlaneStates(planeIndices):
+	"""
+	Get the states of the planes with planeIndices over all times of _collectContext, in a worker process.
+	"""
+	simulation, times = _collectContext
 	planes = simulation.getPlanes()
-	planeToFuel = {plane : [] for plane in planes}
-	
-	# note: producing a simulationLog is expensive, so make that your outer loop.
-	for time in range(int(simulation.getEndTime())):
-		simulationLog = simulation.getSimulationLogAt(time)
-		planeToLog = simulationLog.getPlaneToLog()
+	return [planes[i].getTimeline().getStatesAtTimes(times) for i in planeIndices]
+
+def collectMetrics(simulation, metrics = None, startTime = 0, endTime = None, timeStep = 1, numProcesses = 1):
+	"""
+	Gather all requested metrics (all of metricNames if None) of the simulation from startTime up
+	to endTime (end of the simulation if None) in one pass over the simulation. With numProcesses > 1
+	the planes are split over a pool of processes (which inherit the simulation by forking).
+	:rtype: SimulationMetrics
+	"""
+	global _collectContext
 
-		for plane in planes:
-			planeToFuel[plane].append(planeToLog[plane].getFuel())
+	metrics = list(metricNames) if metrics is None else list(metrics)
+	for name in metrics:
+		if name not in metricNames:
+			raise ValueError("Unknown metric: " + str(name) + ", choose from: " + str(metricNames))
 
+	endTime = int(simulation.getEndTime()) if endTime is None else endTime
+	planes = simulation.getPlanes()
+	connections = simulation.getConnections()
+
+	# both ways of collecting accept the same times and planes, see Simulation.getTimeSeries.
+	times = simulation.getSeriesTimes(startTime, endTime, timeStep)
 	for plane in planes:
-		pylab.plot(range(len(planeToFuel[plane])), planeToFuel[plane], label = str(plane))
+		if len(plane.getTrips()) == 0:
+			raise ValueError("No trips planned for plane %s" %(plane))
+
+	if numProcesses > 1 and len(planes) > 1 and hasattr(os, "fork"):
+		_collectContext = (simulation, times)
+		try:
+			pool = multiprocessing.Pool(numProcesses)
+			try:
+				planeIndexGroups = [range(i, len(planes), numProcesses) for i in range(numProcesses)]
+				groupStates = pool.map(_collectPlaneStates, planeIndexGroups)
+			finally:
+				pool.close()
+				pool.join()
+		finally:
+			_collectContext = None
+
+		states = [None] * len(planes)
+		for planeIndices, planeStates in zip(planeIndexGroups, groupStates):
+			for i, planeState in zip(planeIndices, planeStates):
+				states[i] = planeState
+
+		fuel = numpy.array([state[0] for state in states]).reshape((len(planes), len(times)))
+		numPassengers = numpy.array([state[3] for state in states]).reshape((len(planes), len(times)))
+		passengerKilometers = numpy.array([state[4] for state in states]).reshape((len(planes), len(times)))
+	else:
+		timeSeries = simulation.getTimeSeries(startTime, endTime, timeStep)
+		fuel = timeSeries.getFuel()
+		numPassengers = timeSeries.getNumPassengers()
+		passengerKilometers = timeSeries.getPassengerKilometers()
+
+	nameToSeries = {}
+	if "fuel" in metrics:
+		nameToSeries["fuel"] = fuel
+	if "passengerkilometers" in metrics:
+		nameToSeries["passengerkilometers"] = passengerKilometers
+	if "passengers" in metrics:
+		nameToSeries["passengers"] = numPassengers
+	if "loadfactor" in metrics:
+		maxPassengers = numpy.array([plane.getMaxPassengers() for plane in planes], dtype = float)
+		nameToSeries["loadfactor"] = numPassengers / maxPassengers.reshape((len(planes), 1))
+	if "remainingdemand" in metrics:
+		demandIndex = simulation.getFlightPlan().getDemandIndex()
+		nameToSeries["remainingdemand"] = demandIndex.getPotentialPassengersAt(connections, times)
+
+	return SimulationMetrics(times, planes, connections, nameToSeries)
+
+def _getMetrics(simulation, metrics, name):
+	if metrics is None or not metrics.hasSeries(name):
+		metrics = collectMetrics(simulation, [name])
+	return metrics
+
+def _plotPlaneSeries(metrics, name, title, yLabel, fileName, legendLocation):
+	# pylab is only imported once something is plotted, collecting metrics does not need it.
+	import pylab
 
-	pylab.title("Fuel in planes over the course of the simulation.")
-	pylab.legend(loc = "upper right")
+	series = metrics.getSeries(name)
+	for i, plane in enumerate(metrics.getPlanes()):
+		pylab.plot(metrics.getTimes(), series[i], label = str(plane))
+
+	pylab.title(title)
+	pylab.legend(loc = legendLocation)
 	pylab.xlabel("Time (min)")
-	pylab.ylabel("Fuel (km)")
+	pylab.ylabel(yLabel)
 	pylab.ylim(bottom = 0)
 	pylab.savefig(fileName)
 	pylab.clf()
 
+def plotFuel(simulation, fileName = 'fuel', metrics = None):
+	"""
+	produces a plot of the fuel in the planes over the simulation with timesteps
+	of 1 minute. If metrics (see collectMetrics) contain fuel, those are plotted.
+	"""
+
+	print "Plotting fuel, this might take a while depending on the size of the simulation."
+
+	metrics = _getMetrics(simulation, metrics, "fuel")
+	_plotPlaneSeries(metrics, "fuel", "Fuel in planes over the course of the simulation.",
+	                 "Fuel (km)", fileName, "upper right")
+
 	print "Finished plotting fuel."
 
-def plotPassengerKilometers(simulation, fileName = 'passengerkilometers'):
+def plotPassengerKilometers(simulation, fileName = 'passengerkilometers', metrics = None):
 	"""
 	produces a plot of the passenger kilometers in the planes over the 
-	simulation with timesteps of 1 minute.
+	simulation with timesteps of 1 minute. If metrics (see collectMetrics)
+	contain passenger kilometers, those are plotted.
 	"""
 
 	print "Plotting passenger kilometers, this might take a while depending on the size of the simulation."
 
-	planes = simulation.getPlanes()
-	planeToPassengerKilometers = {plane : [] for plane in planes}
+	metrics = _getMetrics(simulation, metrics, "passengerkilometers")
+	_plotPlaneSeries(metrics, "passengerkilometers", "Passenger kilometers by planes over the course of the simulation.",
+	                 "Passenger Kilometers", fileName, "upper left")
+	
+	print "Finished plotting passenger kilometers."
 
-	# note: producing a simulationLog is expensive, so make that your outer loop.
-	for time in range(int(simulation.getEndTime())):
-		simulationLog = simulation.getSimulationLogAt(time)
-		planeToLog = simulationLog.getPlaneToLog()
+def plotLoadFactor(simulation, fileName = 'loadfactor', metrics = None):
+	"""
+	produces a plot of the load factor (passengers on board / max passengers)
+	of the planes over the simulation with timesteps of 1 minute.
+	"""
 
-		for plane in planes:
-			planeToPassengerKilometers[plane].append(planeToLog[plane].getPassengerKilometers())
+	metrics = _getMetrics(simulation, metrics, "loadfactor")
+	_plotPlaneSeries(metrics, "loadfactor", "Load factor of planes over the course of the simulation.",
+	                 "Load factor", fileName, "upper right")
 
-	for plane in planes:
-		pylab.plot(range(len(planeToPassengerKilometers[plane])), planeToPassengerKilometers[plane], label = str(plane))
+def plotPassengers(simulation, fileName = 'passengers', metrics = None):
+	"""
+	produces a plot of the passengers on board of the planes over the simulation
+	with timesteps of 1 minute.
+	"""
+
+	metrics = _getMetrics(simulation, metrics, "passengers")
+	_plotPlaneSeries(metrics, "passengers", "Passengers on board of planes over the course of the simulation.",
+	                 "Passengers", fileName, "upper right")
+
+def plotRemainingDemand(simulation, fileName = 'remainingdemand', metrics = None):
+	"""
+	produces a plot of the total number of passengers still willing to travel over
+	all connections over the simulation with timesteps of 1 minute.
+	"""
+	import pylab
 
-	pylab.title("Passenger kilometers by planes over the course of the simulation.")
-	pylab.legend(loc = "upper left")
+	metrics = _getMetrics(simulation, metrics, "remainingdemand")
+	pylab.plot(metrics.getTimes(), metrics.getSeries("remainingdemand").sum(axis = 0))
+
+	pylab.title("Remaining demand over the course of the simulation.")
 	pylab.xlabel("Time (min)")
-	pylab.ylabel("Passenger Kilometers")
+	pylab.ylabel("Potential passengers")
 	pylab.ylim(bottom = 0)
 	pylab.savefig(fileName)
 	pylab.clf()
-	
-	print "Finished plotting passenger kilometers."
\ No newline at end of file
+
+def plotAll(simulation, numProcesses = 1):
+	"""
+	produces all plots (fuel, passengerkilometers, loadfactor, passengers and
+	remainingdemand) from a single pass over the simulation.
+	"""
+
+	metrics = collectMetrics(simulation, numProcesses = numProcesses)
+	plotFuel(simulation, metrics = metrics)
+	plotPassengerKilometers(simulation, metrics = metrics)
+	plotLoadFactor(simulation, metrics = metrics)
+	plotPassengers(simulation, metrics = metrics)
+	plotRemainingDemand(simulation, metrics = metrics)
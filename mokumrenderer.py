@@ -0,0 +1,196 @@
+from __future__ import division
+
+import argparse
+import math
+import multiprocessing
+import os
+import sys
+
+from PIL import Image, ImageDraw, ImageFont
+from mokum import Simulation
+from mokumdrawing import generateColors, deviationX, deviationY
+
+mapOffset = (10, 10) # position of the map on a frame, as on the canvas of the GUI.
+mapSize = (450, 450) # size of the map part of a frame, as the canvas of the GUI.
+tableWidth = 260 # width of the table next to the map.
+rowHeight = 12 # height of a row of text in the table.
+arrowSize = 8 # length of the head of a trip arrow.
+backgroundColor = "#ffffff"
+textColor = "#000000"
+
+# set in the rendering process before the pool is created, inherited by the worker processes.
+_renderContext = None
+
+class FrameRenderer(object):
+    """
+    Draws frames of a simulation to images without a window, the same way the GUI draws
+    them on its canvas: the map of europe, a rectangle for every waiting plane and an arrow
+    from its start location for every plane on a trip. Next to the map a table lists the
+    time and the fuel, passengers and passenger kilometers of every plane (as far as they fit).
+    """
+
+    def __init__(self, simulation, mapFileName = None):
+        if mapFileName is None:
+            mapFileName = simulation.getResourcesPath() + "/europe.gif"
+
+        self.simulation = simulation
+        self.planes = simulation.getPlanes()
+        self.planeToColor = dict(zip(self.planes, generateColors(len(self.planes))))
+        self.mapImage = Image.open(mapFileName).convert("RGB")
+        self.font = ImageFont.load_default()
+        self.cursor = simulation.getCursor()
+
+    def renderAt(self, time):
+        """
+        Render the frame at time.
+        :rtype: PIL.Image
+        """
+        self.cursor.seek(time)
+        simulationLog = self.cursor.getSimulationLog()
+
+        image = Image.new("RGB", (mapSize[0] + tableWidth, mapSize[1]), backgroundColor)
+        image.paste(self.mapImage, mapOffset)
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((mapSize[0], 0, image.size[0], image.size[1]), fill = backgroundColor) # map beyond the canvas.
+
+        for plane in self.planes:
+            self._drawPlane(draw, simulationLog.getPlaneLog(plane), self.planeToColor[plane])
+
+        self._drawTable(draw, simulationLog)
+        return image
+
+    def _drawPlane(self, draw, planeLog, color):
+        x, y = planeLog.getCoords()
+        x += deviationX
+        y += deviationY
+        trip = planeLog.getTrip()
+
+        if trip is None:
+            draw.rectangle((x - 3, y - 3, x + 3, y + 3), fill = color, outline = textColor)
+            return
+
+        x1, y1 = trip.getConnection().getStartLocation().getCoords()
+        x1 += deviationX
+        y1 += deviationY
+        draw.line((x1, y1, x, y), fill = color, width = 3)
+
+        # head of the arrow, pointing in the direction of flight.
+        length = math.hypot(x - x1, y - y1)
+        if length > 0:
+            cosAlpha, sinAlpha = (x - x1) / length, (y - y1) / length
+            left = (x - arrowSize * cosAlpha + arrowSize / 2 * sinAlpha, y - arrowSize * sinAlpha - arrowSize / 2 * cosAlpha)
+            right = (x - arrowSize * cosAlpha - arrowSize / 2 * sinAlpha, y - arrowSize * sinAlpha + arrowSize / 2 * cosAlpha)
+            draw.polygon([(x, y), left, right], fill = color)
+
+    def _drawTable(self, draw, simulationLog):
+        left = mapSize[0] + 5
+        top = 5
+        draw.text((left, top), "time: %.2f" %(simulationLog.getTime()), fill = textColor, font = self.font)
+        top += 2 * rowHeight
+
+        draw.text((left, top), "plane         fuel  pass      pkm", fill = textColor, font = self.font)
+        top += rowHeight
+
+        for plane in self.planes:
+            if top + rowHeight > mapSize[1]:
+                draw.text((left, top), "...", fill = textColor, font = self.font)
+                break
+
+            planeLog = simulationLog.getPlaneLog(plane)
+            row = "%-10s %7.1f %5d %8d" %(str(plane)[:10], planeLog.getFuel(), planeLog.getNumPassengers(),
+                                           planeLog.getPassengerKilometers())
+            draw.text((left, top), row, fill = self.planeToColor[plane], font = self.font)
+            top += rowHeight
+
+def _renderFrame(job):
+    """
+    Render one frame in a worker process, with the renderer of _renderContext.
+    :param job: tuple (frame number, time).
+    :returns: (frame number, file name) for a png sequence, else (frame number, image).
+    """
+    renderer, fileNamePattern = _renderContext
+    frameNumber, time = job
+    image = renderer.renderAt(time)
+
+    if fileNamePattern is not None:
+        fileName = fileNamePattern %(frameNumber)
+        image.save(fileName)
+        return frameNumber, fileName
+
+    # a palette image is much smaller to send back to the rendering process.
+    return frameNumber, image.convert("P", palette = Image.ADAPTIVE)
+
+def renderFrames(simulation, output, startTime = None, endTime = None, timeStep = 1, outputFormat = "gif",
+                 numProcesses = None, frameDuration = 50, mapFileName = None):
+    """
+    Render the frames from startTime up to endTime (exclusive) with steps of timeStep, on a
+    pool of numProcesses processes (all cores if None, 1 renders in this process).
+    :param output: file name of the gif, or directory of the png sequence (frame00000.png, ...).
+    :param outputFormat: "gif" or "png".
+    :param frameDuration: time in ms each frame of the gif is shown.
+    :returns: number of frames rendered.
+    """
+    global _renderContext
+
+    if outputFormat not in ("gif", "png"):
+        raise ValueError("Unknown output format: " + str(outputFormat) + ", choose from: gif, png")
+    if timeStep <= 0:
+        raise ValueError("Rendering with time step: " + str(timeStep) + " which is <= 0.")
+
+    startTime = simulation.getStartTime() if startTime is None else startTime
+    endTime = simulation.getEndTime() if endTime is None else endTime
+    numFrames = int(math.ceil((endTime - startTime) / timeStep))
+    jobs = [(i, startTime + i * timeStep) for i in range(numFrames)]
+
+    fileNamePattern = None
+    if outputFormat == "png":
+        if not os.path.isdir(output):
+            os.makedirs(output)
+        fileNamePattern = os.path.join(output, "frame%05d.png")
+
+    # worker processes inherit the simulation by forking, it cannot be pickled.
+    if numProcesses is None:
+        numProcesses = multiprocessing.cpu_count()
+    if not hasattr(os, "fork"):
+        numProcesses = 1
+
+    _renderContext = (FrameRenderer(simulation, mapFileName), fileNamePattern)
+    try:
+        if numProcesses > 1 and numFrames > 1:
+            pool = multiprocessing.Pool(numProcesses)
+            chunkSize = max(1, numFrames // (4 * numProcesses)) # consecutive frames per worker, cheap to seek.
+            try:
+                results = pool.map(_renderFrame, jobs, chunkSize)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_renderFrame(job) for job in jobs]
+    finally:
+        _renderContext = None
+
+    if outputFormat == "gif" and numFrames > 0:
+        images = [image for frameNumber, image in sorted(results)]
+        images[0].save(output, save_all = True, append_images = images[1:], duration = frameDuration, loop = 0)
+
+    return numFrames
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description = "Render the Mokum Airlines simulation without a window.")
+    parser.add_argument("output", help = "gif file, or directory for a png sequence")
+    parser.add_argument("--format", default = "gif", choices = ["gif", "png"], help = "output format")
+    parser.add_argument("--start", type = float, default = None, help = "first time (default: start of simulation)")
+    parser.add_argument("--end", type = float, default = None, help = "end time (default: end of simulation)")
+    parser.add_argument("--step", type = float, default = 5, help = "time between two frames")
+    parser.add_argument("--processes", type = int, default = None, help = "number of processes (default: all cores)")
+    parser.add_argument("--duration", type = int, default = 50, help = "ms per frame of the gif")
+    parser.add_argument("--resources", default = "resources", help = "directory of the simulation files")
+    args = parser.parse_args(arguments)
+
+    simulation = Simulation(resourcesPath = args.resources)
+    numFrames = renderFrames(simulation, args.output, args.start, args.end, args.step, args.format,
+                             args.processes, args.duration)
+    print "Rendered", numFrames, "frames to", args.output
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
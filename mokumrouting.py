@@ -0,0 +1,299 @@
+from __future__ import division
+
+import argparse
+import heapq
+import sys
+
+from mokum import Simulation
+
+class Itinerary(object):
+    """
+    numPassengers passengers of connection boarding plane at the start of the first of trips
+    and leaving it at the end of the last, the first time the plane lands at the end location
+    of connection.
+    """
+
+    def __init__(self, plane, trips, connection, numPassengers):
+        self.plane = plane
+        self.trips = trips
+        self.connection = connection
+        self.numPassengers = numPassengers
+
+    def __str__(self):
+        return str(self.numPassengers) + " x " + str(self.connection) + " with plane: " + str(self.plane) +\
+               " over trips: " + ", ".join(trip.getName() for trip in self.trips)
+
+    def getPlane(self):
+        return self.plane
+
+    def getTrips(self):
+        return self.trips
+
+    def getConnection(self):
+        return self.connection
+
+    def getNumPassengers(self):
+        return self.numPassengers
+
+    def getPassengerKilometers(self):
+        return self.numPassengers * self.connection.getDistance()
+
+class MinCostFlow(object):
+    """
+    Minimum cost flow with successive shortest paths: flow is sent over the cheapest path
+    in the residual network, found with Dijkstra on costs reduced by node potentials.
+    Every arc goes from a lower to a higher numbered node, as in a time-expanded network,
+    so the first potentials follow from a single pass over the nodes, negative costs included.
+    """
+
+    def __init__(self, numNodes):
+        self.numNodes = numNodes
+        self.nodeToArcs = [[] for node in range(numNodes)]
+        # arc 2k is the k-th arc added, arc 2k + 1 its reverse in the residual network.
+        self.ends = []
+        self.capacities = []
+        self.costs = []
+
+    def addArc(self, start, end, capacity, cost):
+        """
+        Add an arc from start to end, returns its index (for getFlow).
+        """
+        if not 0 <= start < end < self.numNodes:
+            raise ValueError("Arc from node: " + str(start) + " to node: " + str(end) +\
+                             " does not go to a higher node in a network of " + str(self.numNodes) + " nodes.")
+
+        arc = len(self.ends)
+        self.nodeToArcs[start].append(arc)
+        self.ends.append(end)
+        self.capacities.append(capacity)
+        self.costs.append(cost)
+        self.nodeToArcs[end].append(arc + 1)
+        self.ends.append(start)
+        self.capacities.append(0)
+        self.costs.append(-cost)
+        return arc
+
+    def getFlow(self, arc):
+        return self.capacities[arc + 1]
+
+    def solve(self, source, sink, maxFlow):
+        """
+        Send at most maxFlow from source to sink at minimum cost.
+        :returns: flow sent and its total cost.
+        """
+        infinity = float("inf")
+        ends, capacities, costs, nodeToArcs = self.ends, self.capacities, self.costs, self.nodeToArcs
+
+        potentials = [infinity] * self.numNodes
+        potentials[source] = 0
+        for node in range(source, self.numNodes):
+            if potentials[node] < infinity:
+                for arc in nodeToArcs[node]:
+                    if capacities[arc] > 0 and potentials[node] + costs[arc] < potentials[ends[arc]]:
+                        potentials[ends[arc]] = potentials[node] + costs[arc]
+
+        flow = 0
+        totalCost = 0
+        while flow < maxFlow:
+            distances = [infinity] * self.numNodes
+            previousArcs = [-1] * self.numNodes
+            distances[source] = 0
+            queue = [(0, source)]
+
+            while queue:
+                distance, node = heapq.heappop(queue)
+                if distance > distances[node]:
+                    continue
+                if node == sink:
+                    break
+
+                nodePotential = potentials[node]
+                for arc in nodeToArcs[node]:
+                    if capacities[arc] > 0:
+                        end = ends[arc]
+                        endDistance = distance + costs[arc] + nodePotential - potentials[end]
+                        if endDistance < distances[end]:
+                            distances[end] = endDistance
+                            previousArcs[end] = arc
+                            heapq.heappush(queue, (endDistance, end))
+
+            sinkDistance = distances[sink]
+            if sinkDistance == infinity:
+                break
+
+            # nodes not settled before the sink are at least as far, which keeps reduced costs >= 0.
+            for node in range(self.numNodes):
+                if potentials[node] < infinity:
+                    potentials[node] += min(distances[node], sinkDistance)
+
+            pathFlow = maxFlow - flow
+            node = sink
+            while node != source:
+                arc = previousArcs[node]
+                pathFlow = min(pathFlow, capacities[arc])
+                node = ends[arc ^ 1]
+
+            node = sink
+            while node != source:
+                arc = previousArcs[node]
+                capacities[arc] -= pathFlow
+                capacities[arc ^ 1] += pathFlow
+                totalCost += pathFlow * costs[arc]
+                node = ends[arc ^ 1]
+
+            flow += pathFlow
+
+        return flow, totalCost
+
+def _getCandidates(plane, trips, maxLegs):
+    """
+    Get every way passengers can travel with plane: (index of the boarding trip, index of the
+    trip landing at their destination, connection), passengers leave at the first landing there.
+    """
+    endLocations = [trip.getEndLocation() for trip in trips]
+    numLocations = len(set(endLocations) | set(trip.getStartLocation() for trip in trips))
+    candidates = []
+
+    for first, trip in enumerate(trips):
+        startLocation = trip.getStartLocation()
+        visited = set([startLocation])
+        last = len(trips) if maxLegs is None else min(len(trips), first + maxLegs)
+
+        for index in range(first, last):
+            endLocation = endLocations[index]
+            if endLocation in visited:
+                continue
+            visited.add(endLocation)
+
+            connection = startLocation.getConnection(endLocation)
+            if connection is not None:
+                candidates.append((first, index, connection))
+            if len(visited) == numLocations:
+                break
+    return candidates
+
+def _routePlane(plane, trips, connectionToDemand, maxLegs):
+    """
+    Get the number of passengers on every candidate of plane (see _getCandidates), making many
+    passenger kilometers with at most connectionToDemand passengers per connection.
+    The seats of the plane over its trips form a time-expanded network: node k is the moment
+    trip k starts, seats stay empty along the arc from k to k + 1 and passengers of a candidate
+    take their seats along an arc from its boarding trip to the node after its last trip.
+    The network cannot limit the passengers of a connection boarding at different trips
+    together, so while connections get too many, their candidates are fixed to at most what
+    was routed on them (shortest first, up to the demand) and the network is solved again.
+    Each solve is optimal, but after capping the result may not be.
+    """
+    candidates = _getCandidates(plane, trips, maxLegs)
+    maxPassengers = plane.getMaxPassengers()
+    capacities = [min(maxPassengers, connectionToDemand.get(connection, 0)) for first, last, connection in candidates]
+
+    while True:
+        network = MinCostFlow(len(trips) + 1)
+        for index in range(len(trips)):
+            network.addArc(index, index + 1, maxPassengers, 0)
+        arcs = [network.addArc(first, last + 1, capacity, -connection.getDistance())\
+                for (first, last, connection), capacity in zip(candidates, capacities) if capacity > 0]
+        network.solve(0, len(trips), maxPassengers)
+
+        arcs = iter(arcs)
+        flows = [network.getFlow(next(arcs)) if capacity > 0 else 0 for capacity in capacities]
+
+        connectionToRouted = {}
+        for candidate, flow in enumerate(flows):
+            connection = candidates[candidate][2]
+            connectionToRouted[connection] = connectionToRouted.get(connection, 0) + flow
+
+        overbooked = set(connection for connection, routed in connectionToRouted.items()\
+                         if routed > connectionToDemand[connection])
+        if len(overbooked) == 0:
+            return candidates, flows
+
+        connectionToLeft = dict((connection, connectionToDemand[connection]) for connection in overbooked)
+        for candidate in sorted(range(len(candidates)), key = lambda candidate : candidates[candidate][1] - candidates[candidate][0]):
+            connection = candidates[candidate][2]
+            if connection in overbooked:
+                capacities[candidate] = min(flows[candidate], connectionToLeft[connection])
+                connectionToLeft[connection] -= capacities[candidate]
+
+def routePassengers(simulation, maxLegs = None):
+    """
+    Route the passengers of passengers.txt over the trips of the simulation, making many
+    passenger kilometers. Passengers never change planes (they stay on board until the plane
+    lands at their destination), the planes never carry more than their max passengers and
+    no more passengers travel on a connection than its potential passengers.
+    Every plane is routed with a min cost flow over its trips and capping (see _routePlane),
+    the planes one by one (in the order of simulation.getPlanes()) on the passengers left by
+    the planes before. Neither is guaranteed to give the most passenger kilometers.
+    :param maxLegs: maximum number of trips passengers stay on board, unlimited if None.
+    :returns: list of Itineraries, ordered on plane, then on boarding trip.
+    """
+    if maxLegs is not None and maxLegs < 1:
+        raise ValueError("Routing with max legs: " + str(maxLegs) + " which is < 1.")
+
+    connectionToDemand = dict((connection, connection.getPotentialPassengers())\
+                              for connection in simulation.getConnections())
+    itineraries = []
+
+    for plane in simulation.getPlanes():
+        trips = plane.getTrips()
+        if len(trips) == 0:
+            continue
+
+        candidates, flows = _routePlane(plane, trips, connectionToDemand, maxLegs)
+        for (first, last, connection), flow in zip(candidates, flows):
+            if flow > 0:
+                connectionToDemand[connection] -= flow
+                itineraries.append(Itinerary(plane, trips[first:last + 1], connection, flow))
+
+    return itineraries
+
+def getTripPassengers(itineraries):
+    """
+    Get the passengers boarding every trip of the itineraries, as {trip:{connection:numPassengers}}.
+    """
+    tripToPassengers = {}
+    for itinerary in itineraries:
+        passengers = tripToPassengers.setdefault(itinerary.getTrips()[0], {})
+        connection = itinerary.getConnection()
+        passengers[connection] = passengers.get(connection, 0) + itinerary.getNumPassengers()
+    return tripToPassengers
+
+def applyItineraries(simulation, itineraries):
+    """
+    Replace the passengers of all trips of the simulation by those of the itineraries.
+    """
+    trips = simulation.getTrips()
+    for trip in trips:
+        trip.setPassengers({})
+
+    tripToPassengers = getTripPassengers(itineraries)
+    for trip in trips:
+        if trip in tripToPassengers:
+            trip.setPassengers(tripToPassengers[trip])
+
+def writePassengersOnTrip(itineraries, fileName):
+    """
+    Write the passengers of the itineraries in the format of passengersontrip.txt.
+    """
+    with open(fileName, "w") as passengersOnTripFile:
+        for itinerary in itineraries:
+            passengersOnTripFile.write(itinerary.getTrips()[0].getName() + "," + str(itinerary.getNumPassengers()) +\
+                                       "," + itinerary.getConnection().getEndLocation().getName() + "\n")
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description = "Route the passengers of Mokum Airlines over the planned trips.")
+    parser.add_argument("output", help = "file to write the passengers on every trip to, as passengersontrip.txt")
+    parser.add_argument("--resources", default = "resources", help = "directory of the simulation files")
+    parser.add_argument("--maxlegs", type = int, default = None, help = "max trips passengers stay on board")
+    args = parser.parse_args(arguments)
+
+    simulation = Simulation(runPreSimulation = False, resourcesPath = args.resources)
+    itineraries = routePassengers(simulation, args.maxlegs)
+    writePassengersOnTrip(itineraries, args.output)
+
+    print "Routed", sum(itinerary.getNumPassengers() for itinerary in itineraries), "passengers making",\
+          sum(itinerary.getPassengerKilometers() for itinerary in itineraries), "passenger kilometers to", args.output
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
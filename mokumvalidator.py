@@ -0,0 +1,155 @@
+from __future__ import division
+
+import numpy
+
+from mokum import minutesPerDay
+
+# all constraints checked by validate, in the order violations are reported.
+constraints = ["nofly", "home", "rotation", "fuel", "capacity", "demand", "endtime", "overlap"]
+
+class Violation(object):
+    """
+    A constraint (one of constraints) violated by plane, on trips (empty if it concerns all
+    trips of the plane). Demand is violated by all planes together, its plane is None.
+    """
+
+    def __init__(self, constraint, plane, trips, message):
+        self.constraint = constraint
+        self.plane = plane
+        self.trips = trips
+        self.message = message
+
+    def __str__(self):
+        return self.constraint + ": " + self.message
+
+    def getConstraint(self):
+        return self.constraint
+
+    def getPlane(self):
+        return self.plane
+
+    def getTrips(self):
+        return self.trips
+
+    def getMessage(self):
+        return self.message
+
+def _getPlaneBounds(planeIndices, numPlanes):
+    """
+    Get for every plane the index of its first trip and one past its last trip in the table,
+    the table is ordered on plane.
+    """
+    firsts = numpy.searchsorted(planeIndices, numpy.arange(numPlanes), side = "left")
+    ends = numpy.searchsorted(planeIndices, numpy.arange(numPlanes), side = "right")
+    return firsts, ends
+
+def _isInNoFly(simulation, times):
+    if simulation.getCycles() > 1:
+        times = simulation.getStartTime() + (times - simulation.getStartTime()) % minutesPerDay
+    return (simulation.getNoFlyStart() <= times) & (times < simulation.getNoFlyEnd())
+
+def validate(simulation):
+    """
+    Check all trips of the simulation against all constraints at once, with array operations
+    over the TripTable of the simulation. Unlike preSimulation nothing is raised, every
+    violation is returned.
+    :returns: list of Violations, ordered on constraint, then on plane and start time.
+    """
+    tripTable = simulation.getFlightPlan().getTripTable()
+    planes = tripTable.getPlanes()
+    trips = tripTable.getTrips()
+    column = tripTable.getColumn
+    planeIndices = column("plane")
+    startTimes = column("starttime")
+    landTimes = column("landtime")
+    endTimes = column("endtime")
+    distances = column("distance")
+    network = simulation.getFlightPlan().getNetwork()
+    homeIndex = network.getLocationIndex(simulation.getHome())
+
+    firsts, ends = _getPlaneBounds(planeIndices, len(planes))
+    hasTrips = ends > firsts
+    lasts = numpy.maximum(ends - 1, 0)
+    violations = []
+
+    for i in numpy.flatnonzero(_isInNoFly(simulation, startTimes) | _isInNoFly(simulation, landTimes)):
+        violations.append(Violation("nofly", planes[planeIndices[i]], [trips[i]],
+            "Plane: " + str(planes[planeIndices[i]]) + " with trip: " + str(trips[i]) +\
+            " tried to take off or land between noFlyStart: " + str(simulation.getNoFlyStart()) +\
+            " and noFlyEnd: " + str(simulation.getNoFlyEnd()) + ". It tried to take off at: " +\
+            str(startTimes[i]) + "  and tried to land at: " + str(landTimes[i])))
+
+    passesHome = (column("startlocation") == homeIndex) | (column("endlocation") == homeIndex)
+    homeVisits = numpy.bincount(planeIndices, weights = passesHome, minlength = len(planes))
+    for p in numpy.flatnonzero(hasTrips & (homeVisits == 0)):
+        violations.append(Violation("home", planes[p], [],
+            "Plane: " + str(planes[p]) + " did not pass home: " + str(simulation.getHome()) + " atleast once."))
+
+    startLocations = column("startlocation")
+    endLocations = column("endlocation")
+    for p in numpy.flatnonzero(hasTrips):
+        if startLocations[firsts[p]] != endLocations[lasts[p]]:
+            violations.append(Violation("rotation", planes[p], [trips[firsts[p]], trips[lasts[p]]],
+                "Startpoint: " + str(trips[firsts[p]].getStartLocation()) + " and endpoint: " +\
+                str(trips[lasts[p]].getEndLocation()) + " of plane: " + str(planes[p]) + " do not match."))
+
+    # with multiple cycles, trips up to the first refuel start with less fuel in later cycles.
+    fuelBefore = column("fuelbefore").copy()
+    if simulation.getCycles() > 1 and len(trips) > 0:
+        refuels = column("refuel")
+        refuelsBefore = numpy.cumsum(refuels) - refuels - (numpy.cumsum(refuels) - refuels)[firsts[planeIndices]]
+        planeRefuels = numpy.bincount(planeIndices, weights = refuels, minlength = len(planes)) > 0
+        maxFuel = numpy.array([plane.getMaxFuel() for plane in planes], dtype = float)
+        cycleFuelUsed = maxFuel - column("fuelafter")[lasts]
+        laterCycles = numpy.where(planeRefuels, 1, simulation.getCycles() - 1)
+        fuelBefore -= numpy.where(refuelsBefore == 0, (cycleFuelUsed * laterCycles)[planeIndices], 0)
+
+    for i in numpy.flatnonzero(fuelBefore - distances < 0):
+        violations.append(Violation("fuel", planes[planeIndices[i]], [trips[i]],
+            "Fuel for plane: " + str(planes[planeIndices[i]]) + " reached <0 on trip:  " + str(trips[i])))
+
+    for i in numpy.flatnonzero(column("onboard") > column("maxpassengers")):
+        violations.append(Violation("capacity", planes[planeIndices[i]], [trips[i]],
+            "Plane: " + str(planes[planeIndices[i]]) + " cannot carry more than " + str(column("maxpassengers")[i]) +\
+            " Passengers, on board on trip: " + str(trips[i]) + ": " + str(column("onboard")[i])))
+
+    # the trips may have been loaded or changed without the DemandLedger enforcing the demand.
+    demandIndex = simulation.getFlightPlan().getDemandIndex(rebuild = True)
+    for connection in sorted(demandIndex.getConnections(), key = lambda connection : connection.getIndices()):
+        passengersTaken = demandIndex.getTotalPassengersTaken(connection)
+        if passengersTaken > connection.getPotentialPassengers():
+            violations.append(Violation("demand", None, [trip for trip in trips if trip.getNumPassengersOn(connection) > 0],
+                "Trips take " + str(passengersTaken) + " passengers on connection: " + str(connection) +\
+                " which has only " + str(connection.getPotentialPassengers()) + " potential passengers."))
+
+    if len(trips) > 0:
+        if simulation.getCycles() > 1:
+            # planes without trips (first past the last trip) are left out by hasTrips.
+            limits = startTimes[numpy.minimum(firsts, len(trips) - 1)] + simulation.getPeriod()
+            limitName = "the start of its first trip in the next cycle"
+        else:
+            limits = numpy.repeat(float(simulation.getEndTime()), len(planes))
+            limitName = "end time of simulation"
+        for p in numpy.flatnonzero(hasTrips & (endTimes[lasts] > limits)):
+            violations.append(Violation("endtime", planes[p], [trips[lasts[p]]],
+                "Plane: " + str(planes[p]) + " started trip: " + str(trips[lasts[p]]) + " but this trip ends at: " +\
+                str(endTimes[lasts[p]]) + " which is beyond " + limitName + ": " + str(limits[p])))
+
+    # a trip overlaps with the trip of the same plane ending last among the trips before it.
+    if len(trips) > 1:
+        offset = (planeIndices * (endTimes.max() - startTimes.min() + 1)).astype(float)
+        shiftedEnds = endTimes + offset
+        runningMaxEnds = numpy.maximum.accumulate(shiftedEnds)
+        isMax = shiftedEnds == runningMaxEnds
+        maxIndices = numpy.maximum.accumulate(numpy.where(isMax, numpy.arange(len(trips)), 0))
+        samePlane = planeIndices[1:] == planeIndices[:-1]
+        overlaps = samePlane & (startTimes[1:] + offset[1:] < runningMaxEnds[:-1])
+
+        for i in numpy.flatnonzero(overlaps) + 1:
+            j = maxIndices[i - 1]
+            violations.append(Violation("overlap", planes[planeIndices[i]], [trips[j], trips[i]],
+                "Trip collision occured with plane: " + str(planes[planeIndices[i]]) + " between trip: " +\
+                str(trips[j].getName()) + " (" + str(startTimes[j]) + " - " + str(endTimes[j]) + ") and trip: " +\
+                str(trips[i].getName()) + " (" + str(startTimes[i]) + " - " + str(endTimes[i]) + ")"))
+
+    return violations